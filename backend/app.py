@@ -1,31 +1,67 @@
-import tempfile
-from io import BytesIO
-from typing import Optional
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-import httpx, os
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import os, time
 from dotenv import load_dotenv
-from openai import OpenAI
 
-from backend.services.openai_service import OpenAIService
+from backend.services.openai_service import OpenAIService, TTS_MODEL
 from backend.services.scenario_generator import ScenarioGenerator
+from backend.services.scenario_pool import ScenarioPool
 from backend.services.session_manager import SessionManager
+from backend.services.session_cache import SessionCache
 from backend.services.turn_manager import TurnManager
+from backend.services.tts_cache import TTSCache
+from backend.services.llm_cache import LLMCache
+from backend.services.realtime_tokens import RealtimeTokenPool, RealtimeMintError
+from backend.services.voice_pipeline import VoicePipeline, OUTPUT_SAMPLE_RATE, wav_from_pcm
+from backend.services.audio_preprocessing import preprocess_audio
 from backend.utils import redis_client
+from backend.utils.http_client import close_http_client
+from backend.utils import call_scheduler
+from backend.utils.call_scheduler import SchedulerBusy, DeadlineExceeded
+from backend.utils import metrics
+from backend.utils.metrics import span
 from backend.services import scoring
+from backend.services.batch_scoring import score_session_dicts
 
 load_dotenv()
 from pydantic import BaseModel
 
+logger = logging.getLogger(__name__)
+
 
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-oai = OpenAI(api_key=OPENAI_API_KEY)
+SCENARIO_POOL_WARM = os.getenv("SCENARIO_POOL_WARM", "1") == "1"
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# per-worker session cache (SESSION_CACHE_MODE, _MAX_ENTRIES, _TTL_SECONDS configure it); off unless enabled
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "0") == "1"
+VOICE_MAX_UTTERANCE_BYTES = int(os.getenv("VOICE_MAX_UTTERANCE_BYTES", str(10 * 1024 * 1024)))
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 
-app = FastAPI(title="Semantics Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # convert any single-blob sessions left by older deployments to the hash + list layout
+    await redis_client.migrate_sessions(redis)
+    if SCENARIO_POOL_WARM:
+        scenario_pool.warm()
+    if session_manager.cache is not None:
+        session_manager.cache.start_listener(redis)
+    realtime_tokens.start()
+    yield
+    await realtime_tokens.stop()
+    if session_manager.cache is not None:
+        await session_manager.cache.stop_listener()
+    await close_http_client()
+    await redis.aclose()
+
+app = FastAPI(title="Semantics Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,63 +74,236 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RedisRoundTripMiddleware:
+    # counts Redis round trips per request, returns them in X-Redis-Round-Trips and
+    # keeps per-endpoint totals for /debug/redis-round-trips
+    stats = {}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        counter = redis_client.start_round_trip_count()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-redis-round-trips", str(counter[0]).encode())]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                route = scope.get("route")
+                # unmatched paths share one entry so 404 scans can't grow the dict
+                endpoint = f"{scope['method']} {route.path if route else 'unmatched'}"
+                entry = self.stats.setdefault(endpoint, {"requests": 0, "round_trips": 0})
+                entry["requests"] += 1
+                entry["round_trips"] += counter[0]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+app.add_middleware(RedisRoundTripMiddleware)
+
+class DeadlineMiddleware:
+    # outbound OpenAI calls made while handling a request give up once it has run for
+    # REQUEST_DEADLINE_SECONDS; clients can ask for less with X-Request-Timeout (seconds)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        seconds = REQUEST_DEADLINE_SECONDS
+        for name, value in scope["headers"]:
+            if name == b"x-request-timeout":
+                try:
+                    seconds = min(seconds, float(value))
+                except ValueError:
+                    pass
+        call_scheduler.set_deadline(seconds)
+        await self.app(scope, receive, send)
+
+app.add_middleware(DeadlineMiddleware)
+
+class MetricsMiddleware:
+    # request latency histogram for /metrics, plus a Server-Timing header listing the
+    # request's spans when SERVER_TIMING=1 or the client sends X-Server-Timing: 1
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = [500]
+        timing = None
+        if metrics.SERVER_TIMING_ENABLED or (b"x-server-timing", b"1") in scope["headers"]:
+            timing = metrics.start_server_timing()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if timing is not None:
+                    header = metrics.server_timing_header(timing, time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                route = scope.get("route")
+                metrics.HTTP_SECONDS.observe(
+                    time.perf_counter() - started,
+                    method=scope["method"], route=route.path if route else "unmatched", status=status[0]
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(SchedulerBusy)
+async def scheduler_busy(request: Request, exc: SchedulerBusy):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+    return JSONResponse({"detail": str(exc)}, status_code=504)
+
 # Initialize services for frontend
 redis = redis_client.init_redis()
-session_manager = SessionManager(redis_client=redis)
-openai_service = OpenAIService(api_key=OPENAI_API_KEY)
+session_manager = SessionManager(redis_client=redis, cache=SessionCache() if SESSION_CACHE_ENABLED else None)
+openai_service = OpenAIService(api_key=OPENAI_API_KEY, llm_cache=LLMCache(redis))
 turn_manager = TurnManager(session_manager=session_manager, openai_service=openai_service)
 scenario_gen = ScenarioGenerator()
+scenario_pool = ScenarioPool(redis, openai_service, scenario_gen)
+tts_cache = TTSCache()
+voice_pipeline = VoicePipeline(turn_manager, openai_service)
+realtime_tokens = RealtimeTokenPool(OPENAI_API_KEY)
 
 class CreateSessionBody(BaseModel):
     user_name: str = "Tester"
     difficulty: str = "medium"
     duration_seconds: int = 600
     custom_scenario: Optional[str] = None
+    category: Optional[str] = None
+    prewarm_opening: bool = False #generate the AI's opening line + bubbles in the background
 
 class ScoreRequest(BaseModel):
     session_id: str
 
+class BatchScoreRequest(BaseModel):
+    session_ids: List[str] = []
+    sessions: List[dict] = [] #raw Session dicts not stored in Redis; ones that fail validation come back as {"error": ...}
+
 # Frontend connectors setup
 @app.post("/sessions")
 async def create_session(body: CreateSessionBody):
-    session_id = session_manager.create_session(
+    if body.custom_scenario:
+        scenario = await scenario_pool.get_custom_scenario(body.custom_scenario)
+    else:
+        try:
+            scenario = await scenario_pool.get_scenario(difficulty=body.difficulty, category=body.category)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    session_id = await session_manager.create_session(
         user_name=body.user_name,
         difficulty_choice=body.difficulty,
-        chosen_duration_seconds=body.duration_seconds
+        chosen_duration_seconds=body.duration_seconds,
+        context=scenario.model_dump(),
+        opening={"status": "pending"} if body.prewarm_opening else None
     )
+    if body.prewarm_opening:
+        # poll GET /sessions/{id}/opening, or send an empty first /turn to get it as turn 1
+        turn_manager.start_opening(session_id, scenario)
+    return {"session_id": session_id, "scenario": scenario.model_dump(), "opening_pending": body.prewarm_opening}
 
-    if body.custom_scenario:
-        scenario = scenario_gen.generate_custom_scenario(body.custom_scenario)
-    else:
-        scenario = scenario_gen.generate_random_scenario(difficulty=body.difficulty)
-
-    session_manager.update_session(session_id, {"context": scenario.dict()})
-    return {"session_id": session_id, "scenario": scenario.dict()}
+@app.get("/sessions/{session_id}/opening")
+async def get_opening(session_id: str, wait: float = 0.0):
+    try:
+        return await turn_manager.get_opening(session_id, wait_seconds=min(wait, 30.0))
+    except Exception as e:
+        raise HTTPException(404, f"Session not found: {e}")
 
 class TurnBody(BaseModel):
     session_id: str
     user_input: str
+    defer_bubbles: bool = False
 
 @app.post("/turn")
 async def turn(body: TurnBody):
-    if not session_manager.check_session_timeout(body.session_id, turn_manager):
-        raise HTTPException(410, "Session has expired")
+    session = await session_manager.load_active_session(body.session_id, turn_manager)
+    if session is None:
+        raise HTTPException(410, "Session has ended or expired")
     
-    turn = turn_manager.process_user_turn(session_id=body.session_id, user_input=body.user_input)
-    return {"turn": turn.dict()}
+    turn = await turn_manager.process_user_turn(
+        session_id=body.session_id,
+        user_input=body.user_input,
+        defer_bubbles=body.defer_bubbles,
+        session=session
+    )
+    return {"turn": turn.model_dump()}
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/turn/stream")
+async def turn_stream(body: TurnBody):
+    session = await session_manager.load_active_session(body.session_id, turn_manager)
+    if session is None:
+        raise HTTPException(410, "Session has ended or expired")
+    # once streaming starts the status code is fixed, so reject here if gpt-4o is backed up
+    openai_service.scheduler.check_admission("gpt-4o")
+
+    async def events():
+        try:
+            async for kind, payload in turn_manager.stream_user_turn(
+                session_id=body.session_id,
+                user_input=body.user_input,
+                defer_bubbles=body.defer_bubbles,
+                session=session
+            ):
+                if kind == "delta":
+                    yield sse_event("delta", {"text": payload})
+                elif kind == "turn":
+                    yield sse_event("turn", {"turn": payload.model_dump()})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/sessions/{session_id}/turns/{turn_number}/bubbles")
+async def get_turn_bubbles(session_id: str, turn_number: int, wait: float = 0.0):
+    try:
+        return await turn_manager.get_turn_bubbles(session_id, turn_number, wait_seconds=min(wait, 30.0))
+    except IndexError as e:
+        raise HTTPException(404, str(e))
+    except Exception as e:
+        raise HTTPException(404, f"Session not found: {e}")
 
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)):
     audio_bytes = await file.read()
-    print("filename:", file.filename, "size:", len(audio_bytes), "content_type:", file.content_type)
-
-    bio = BytesIO(audio_bytes)
-    tr = oai.audio.transcriptions.create(
-        model="gpt-4o-transcribe",
-        file=(file.filename, audio_bytes)
 
+    # decode/resample/VAD is CPU work, so it runs off the event loop
+    with span("audio", "preprocess"):
+        prepared = await run_in_threadpool(preprocess_audio, audio_bytes, file.filename)
+    logger.info(
+        "transcribe filename=%s content_type=%s bytes_in=%d bytes_out=%d bytes_saved=%d silent=%s",
+        file.filename, file.content_type, prepared.original_bytes, prepared.processed_bytes,
+        prepared.bytes_saved, prepared.is_silent
     )
-    return {"text": tr.text.strip()}
+
+    stats = {"bytes_in": prepared.original_bytes, "bytes_sent": prepared.processed_bytes, "bytes_saved": prepared.bytes_saved}
+    if prepared.is_silent:
+        return {"text": "", "silent": True, **stats}
+
+    text = await openai_service.transcribe(prepared.filename, prepared.audio)
+    return {"text": text, "silent": False, **stats}
 
 
 @app.post("/speak")
@@ -102,34 +311,349 @@ async def speak_text(body: dict):
     text = body.get("text")
     if not text:
         raise HTTPException(400, "Missing 'text'")
+    voice = body.get("voice", "verse")
+
+    key = TTSCache.make_key(text, voice, TTS_MODEL, "wav")
+    with span("audio", "speak"):
+        audio = await tts_cache.get_or_create(
+            key,
+            lambda tmp_path: openai_service.synthesize_to_file(text, tmp_path, voice=voice)
+        )
+
+    return audio_response(audio, "wav")
+
+AUDIO_MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+    "pcm": "audio/L16;rate=24000;channels=1",
+}
+
+ACCEPT_TO_FORMAT = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/aac": "aac",
+    "audio/flac": "flac",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/l16": "pcm",
+    "audio/pcm": "pcm",
+}
+
+def audio_response(audio: bytes, response_format: str) -> Response:
+    return Response(
+        audio,
+        media_type=AUDIO_MEDIA_TYPES[response_format],
+        headers={"Content-Disposition": f'attachment; filename="speech.{response_format}"'}
+    )
+
+def pick_audio_format(request: Request, requested: Optional[str], default: str = "mp3") -> str:
+    # explicit ?format= wins, then the first supported type in Accept, then the default
+    if requested:
+        if requested not in AUDIO_MEDIA_TYPES:
+            raise HTTPException(400, f"Unsupported format '{requested}'")
+        return requested
+    for part in request.headers.get("accept", "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in ACCEPT_TO_FORMAT:
+            return ACCEPT_TO_FORMAT[media_type]
+    return default
+
+@app.post("/speak/stream")
+async def speak_stream(body: dict, request: Request, format: Optional[str] = None):
+    text = body.get("text")
+    if not text:
+        raise HTTPException(400, "Missing 'text'")
+    voice = body.get("voice", "verse")
+    response_format = pick_audio_format(request, format or body.get("format"))
+    media_type = AUDIO_MEDIA_TYPES[response_format]
+
+    key = TTSCache.make_key(text, voice, TTS_MODEL, response_format)
+    audio = await tts_cache.lookup(key)
+    if audio is not None:
+        return audio_response(audio, response_format)
+
+    openai_service.scheduler.check_admission(TTS_MODEL)
+    # forward chunks as the speech API produces them; the cache keeps a copy once the stream completes
+    chunks = openai_service.stream_speech(text, voice=voice, response_format=response_format)
+    return StreamingResponse(tts_cache.tee(key, chunks), media_type=media_type)
+
+VOICE_INPUT_FORMATS = ("wav", "webm", "pcm")
+
+def voice_options(options: dict, control: dict) -> dict:
+    # the options a "start" message sets, checked before they are used for any utterance
+    updated = dict(options)
+    if "format" in control:
+        if control["format"] not in VOICE_INPUT_FORMATS:
+            raise ValueError(f"Unsupported format '{control['format']}'")
+        updated["format"] = control["format"]
+    if "sample_rate" in control:
+        sample_rate = control["sample_rate"]
+        if not isinstance(sample_rate, int) or isinstance(sample_rate, bool) or sample_rate <= 0:
+            raise ValueError("sample_rate must be a positive integer")
+        updated["sample_rate"] = sample_rate
+    if "voice" in control:
+        if not isinstance(control["voice"], str) or not control["voice"]:
+            raise ValueError("voice must be a non-empty string")
+        updated["voice"] = control["voice"]
+    if "defer_bubbles" in control:
+        if not isinstance(control["defer_bubbles"], bool):
+            raise ValueError("defer_bubbles must be a boolean")
+        updated["defer_bubbles"] = control["defer_bubbles"]
+    return updated
+
+# Voice channel: one WebSocket per session replaces the /transcribe -> /turn -> /speak round trips.
+# Client -> server:
+#   {"type": "start", "format": "wav"|"webm"|"pcm", "sample_rate": 16000, "voice": "verse", "defer_bubbles": false}
+#       optional, sets the options for the utterances that follow
+#   binary frames: audio of the current utterance (raw 16-bit mono PCM when format is "pcm")
+#   {"type": "end"}: the utterance is complete, run it through the pipeline
+#   {"type": "cancel"}: drop the audio received so far
+# Server -> client:
+#   {"type": "ready"}, {"type": "transcript"}, {"type": "delta"}, binary frames of 24 kHz 16-bit
+#   mono PCM, {"type": "audio_end"}, {"type": "turn"}, {"type": "latency", "stages": {stage: ms}}
+#   and {"type": "error", "status", "detail"}
+@app.websocket("/sessions/{session_id}/voice")
+async def voice_session(websocket: WebSocket, session_id: str):
+    await websocket.accept()
+    options = {"format": "webm", "sample_rate": 16000, "voice": "verse", "defer_bubbles": False}
+    audio = bytearray()
+
+    async def send_error(status: int, detail: str):
+        await websocket.send_json({"type": "error", "status": status, "detail": detail})
 
-    out = tempfile.mktemp(suffix=".wav")
+    try:
+        try:
+            session = await session_manager.load_active_session(session_id, turn_manager)
+        except Exception as e:
+            await send_error(404, f"Session not found: {e}")
+            await websocket.close(code=4404)
+            return
+        if session is None:
+            await send_error(410, "Session has ended or expired")
+            await websocket.close(code=4410)
+            return
+        await websocket.send_json({"type": "ready", "audio_format": "pcm", "sample_rate": OUTPUT_SAMPLE_RATE})
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                if len(audio) + len(message["bytes"]) > VOICE_MAX_UTTERANCE_BYTES:
+                    audio.clear()
+                    await send_error(413, "Utterance too long")
+                    continue
+                audio.extend(message["bytes"])
+                continue
+
+            try:
+                control = json.loads(message.get("text") or "")
+            except ValueError:
+                control = None
+            if not isinstance(control, dict):
+                await send_error(400, "Expected a JSON control message")
+                continue
+            kind = control.get("type")
+            if kind == "start":
+                try:
+                    options = voice_options(options, control)
+                except ValueError as e:
+                    await send_error(400, str(e))
+                    continue
+                audio.clear()
+            elif kind == "cancel":
+                audio.clear()
+            elif kind == "end":
+                utterance, filename = bytes(audio), f"speech.{options['format']}"
+                audio.clear()
+                if options["format"] == "pcm":
+                    utterance, filename = wav_from_pcm(utterance, options["sample_rate"]), "speech.wav"
+                if not await run_voice_turn(websocket, session_id, utterance, filename, options):
+                    await websocket.close(code=4410)
+                    return
+            else:
+                await send_error(400, f"Unknown message type '{kind}'")
+    except WebSocketDisconnect:
+        pass
+
+async def run_voice_turn(websocket: WebSocket, session_id: str, audio: bytes, filename: str, options: dict) -> bool:
+    # returns False once the session is over and the socket should be closed
+    try:
+        session = await session_manager.load_active_session(session_id, turn_manager)
+    except Exception as e:
+        await websocket.send_json({"type": "error", "status": 404, "detail": f"Session not found: {e}"})
+        return False
+    if session is None:
+        await websocket.send_json({"type": "error", "status": 410, "detail": "Session has ended or expired"})
+        return False
 
-    with oai.audio.speech.with_streaming_response.create(
-        model="gpt-4o-mini-tts",
-        voice="verse",
-        input=text,
-        response_format="wav",
-    ) as resp:
-        resp.stream_to_file(out)
+    # each utterance gets the same outbound deadline an HTTP request would
+    call_scheduler.set_deadline(REQUEST_DEADLINE_SECONDS)
+    try:
+        openai_service.scheduler.check_admission("gpt-4o")
+        async for kind, payload in voice_pipeline.run(
+            session_id, audio, filename,
+            session=session,
+            voice=options["voice"],
+            defer_bubbles=bool(options["defer_bubbles"])
+        ):
+            if kind == "audio":
+                await websocket.send_bytes(payload)
+            elif kind == "transcript":
+                await websocket.send_json({"type": "transcript", **payload})
+            elif kind == "delta":
+                await websocket.send_json({"type": "delta", "text": payload})
+            elif kind == "audio_end":
+                await websocket.send_json({"type": "audio_end"})
+            elif kind == "turn":
+                await websocket.send_json({"type": "turn", "turn": payload.model_dump()})
+            else:
+                await websocket.send_json({"type": "latency", "stages": payload})
+    except SchedulerBusy as e:
+        await websocket.send_json({"type": "error", "status": 503, "detail": str(e), "retry_after": e.retry_after})
+    except DeadlineExceeded as e:
+        await websocket.send_json({"type": "error", "status": 504, "detail": str(e)})
+    except WebSocketDisconnect:
+        raise
+    except Exception as e:
+        logger.exception("Voice turn failed for session %s", session_id)
+        await websocket.send_json({"type": "error", "status": 500, "detail": str(e)})
+    return True
 
-    return FileResponse(out, media_type="audio/wav", filename="speech.wav")
+@app.get("/speak/cache/stats")
+async def speak_cache_stats():
+    return tts_cache.stats()
 @app.post("/sessions/{session_id}/end")
 async def end_session_early(session_id: str):
     try:
-        feedback = turn_manager.end_session_feedback(session_id)
+        feedback = await turn_manager.end_session_feedback(session_id)
         return {"feedback": feedback, "session_ended": True}
     except Exception as e:
         raise HTTPException(404, f"Session not found: str{e}") 
 
 @app.post("/sessions/{session_id}/score")
 async def score_session(session_id: str):
-    result = turn_manager.end_session_feedback(session_id)
+    result = await turn_manager.end_session_feedback(session_id)
     return {
-        "metrics": result["metrics"].dict(),
+        "metrics": result["metrics"].model_dump(),
         "feedback_messages": result["feedback_messages"]
     }
 
+@app.get("/sessions/{session_id}/score")
+async def live_score(session_id: str):
+    try:
+        return await turn_manager.get_live_scores(session_id)
+    except Exception as e:
+        raise HTTPException(404, f"Session not found: {e}")
+
+@app.post("/scores/batch")
+async def score_batch(body: BatchScoreRequest):
+    stored = await redis_client.load_sessions(redis, body.session_ids)
+    # tokenizing thousands of sessions is CPU work, so keep it off the event loop
+    results = await run_in_threadpool(score_session_dicts, stored + body.sessions)
+
+    def serialize(result):
+        if result is None or "error" in result:
+            return result
+        return {"metrics": result["metrics"].model_dump(), "feedback_messages": result["feedback_messages"]}
+
+    return {
+        "scores": {session_id: serialize(r) for session_id, r in zip(body.session_ids, results)},
+        "session_scores": [serialize(r) for r in results[len(body.session_ids):]],
+    }
+
+@app.get("/debug/redis-round-trips")
+async def redis_round_trips():
+    return {
+        endpoint: {**entry, "avg_per_request": round(entry["round_trips"] / entry["requests"], 2)}
+        for endpoint, entry in RedisRoundTripMiddleware.stats.items()
+    }
+
+def _scheduler_metrics():
+    stats = openai_service.scheduler.stats()
+    lines = []
+    for name, field, help_text, kind in [
+        ("semantics_openai_queue_depth", "queue_depth", "Calls waiting for a concurrency slot.", "gauge"),
+        ("semantics_openai_in_flight", "in_flight", "Calls holding a concurrency slot.", "gauge"),
+        ("semantics_openai_calls_total", "calls", "Calls admitted by the scheduler.", "counter"),
+        ("semantics_openai_rejected_total", "rejected", "Calls rejected because the queue was full.", "counter"),
+        ("semantics_openai_retries_total", "retries", "Retried attempts after 429/5xx or connection errors.", "counter"),
+        ("semantics_openai_deadline_exceeded_total", "deadline_exceeded", "Calls abandoned at the request deadline.", "counter"),
+        ("semantics_openai_wait_seconds_total", "wait_seconds_total", "Time spent waiting for a slot or rate-limit token.", "counter"),
+    ]:
+        lines.extend(metrics.gauge_lines(name, help_text, [({"model": model}, entry[field]) for model, entry in stats.items()], kind))
+    return lines
+
+def _tts_cache_metrics():
+    stats = tts_cache.stats()
+    return (
+        metrics.gauge_lines("semantics_tts_cache_hits_total", "TTS cache hits.", [({}, stats["hits"])], "counter")
+        + metrics.gauge_lines("semantics_tts_cache_misses_total", "TTS cache misses.", [({}, stats["misses"])], "counter")
+        + metrics.gauge_lines("semantics_tts_cache_bytes", "Bytes of audio in the TTS cache.", [({}, stats["bytes"])])
+    )
+
+def _session_cache_metrics():
+    if session_manager.cache is None:
+        return []
+    stats = session_manager.cache.stats()
+    return (
+        metrics.gauge_lines("semantics_session_cache_hits_total", "Session reads served from the worker cache.", [({}, stats["hits"])], "counter")
+        + metrics.gauge_lines("semantics_session_cache_misses_total", "Session reads that went to Redis.", [({}, stats["misses"])], "counter")
+        + metrics.gauge_lines("semantics_session_cache_entries", "Sessions held in the worker cache.", [({}, stats["entries"])])
+        + metrics.gauge_lines("semantics_session_cache_bytes", "Approximate encoded size of the cached sessions.", [({}, stats["bytes"])])
+    )
+
+def _llm_cache_metrics():
+    stats = openai_service.llm_cache.stats()
+    return metrics.gauge_lines(
+        "semantics_llm_cache_hit_ratio", "Share of cacheable LLM calls served without an upstream request.",
+        [({"kind": kind}, entry["hit_ratio"]) for kind, entry in stats["kinds"].items()]
+    )
+
+def _realtime_token_metrics():
+    stats = realtime_tokens.stats()
+    return (
+        metrics.gauge_lines("semantics_realtime_tokens_pooled", "Pre-minted realtime sessions ready to hand out.", [({}, stats["pooled"])])
+        + metrics.gauge_lines(
+            "semantics_realtime_token_requests_total", "Realtime session requests by how they were served.",
+            [({"result": result}, stats[result]) for result in ("hits", "coalesced", "misses")], "counter"
+        )
+        + metrics.gauge_lines("semantics_realtime_tokens_minted_total", "Realtime sessions minted upstream.", [({}, stats["minted"])], "counter")
+    )
+
+metrics.REGISTRY.register_collector(_scheduler_metrics)
+metrics.REGISTRY.register_collector(_realtime_token_metrics)
+metrics.REGISTRY.register_collector(_llm_cache_metrics)
+metrics.REGISTRY.register_collector(_session_cache_metrics)
+metrics.REGISTRY.register_collector(_tts_cache_metrics)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/session-cache")
+async def session_cache_stats():
+    if session_manager.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **session_manager.cache.stats()}
+
+@app.get("/debug/llm-cache")
+async def llm_cache_stats():
+    return openai_service.llm_cache.stats()
+
+@app.get("/debug/realtime-tokens")
+async def realtime_token_stats():
+    return realtime_tokens.stats()
+
+@app.get("/debug/openai-scheduler")
+async def openai_scheduler_stats():
+    return openai_service.scheduler.stats()
+
 @app.get("/health")
 async def health():
     return {"ok": True}
@@ -139,10 +663,8 @@ async def health():
 async def realtime_ephemeral():
     if not OPENAI_API_KEY:
         raise HTTPException(500, "OPENAI_API_KEY not set")
-    payload = {"model": "gpt-4o-realtime-preview", "voice": "verse", "modalities": ["audio","text"]}
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-    async with httpx.AsyncClient(timeout=10) as client:
-        response = await client.post("https://api.openai.com/v1/realtime/sessions", json=payload, headers=headers)
-        if response.status_code >= 400:
-            raise HTTPException(500, f"OpenAI error: {response.text}")
-        return response.json()
\ No newline at end of file
+    # usually a pre-minted session from the pool; otherwise one upstream call shared by concurrent requests
+    try:
+        return await realtime_tokens.acquire()
+    except RealtimeMintError as e:
+        raise HTTPException(500, str(e))
\ No newline at end of file
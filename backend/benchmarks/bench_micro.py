@@ -0,0 +1,89 @@
+# Micro-benchmarks for the CPU work on the turn path: scoring, session (de)serialization
+# and thought-bubble parsing. Numbers are the best of several repeats, per call.
+# Run with: python -m backend.benchmarks.bench_micro [turns] [--json out.json]
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime
+
+from backend.benchmarks.bench_phrase_matcher import make_transcript
+from backend.models.session import Session, TurnData
+from backend.services.openai_service import parse_numbered_list
+from backend.services.scoring import score_conversation, score_from_running, running_scores_for, update_running_scores
+from backend.utils import serialization
+from backend.utils.redis_client import _decode_fields, _encode_fields
+
+VOCAB = ["menu", "recommend", "allergy", "could I have", "the bill", "thank you", "please", "reservation"]
+
+BUBBLE_REPLY = """Here are some things you could say:
+1. Could you recommend something that isn't too spicy?
+2. I'd like a table for two by the window, please.
+- Sorry, could you repeat the specials?
+4. Thank you, I'll have the soup of the day.
+"""
+
+def make_session(turns: int) -> Session:
+    rng = random.Random(3)
+    history = [
+        TurnData(
+            turn_number=i + 1,
+            user_input=text,
+            ai_response="That sounds lovely, what else would you like to know?",
+            timestamp=datetime.now().isoformat(),
+            bubble_suggestions=[{"suggestion_text": s, "complexity_level": "B1"} for s in parse_numbered_list(BUBBLE_REPLY)],
+        ).model_dump()
+        for i, text in enumerate(make_transcript(turns, seed=rng.randint(0, 1000)))
+    ]
+    return Session(
+        session_id="bench",
+        user_name="Bench",
+        cefr_level="B1",
+        context={"category": "Dining", "description": "A cafe.", "role": "Customer",
+                 "objectives": ["Order"], "vocabulary_focus": VOCAB, "difficulty": "B1"},
+        turn_history=history,
+        current_scores={"running": running_scores_for(history, VOCAB)},
+        start_time=datetime.now().isoformat(),
+        duration_seconds=600,
+    )
+
+def bench(fn, number: int, repeat: int = 5) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn-path micro-benchmarks")
+    parser.add_argument("turns", type=int, nargs="?", default=30)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    session = make_session(args.turns)
+    history = session.turn_history
+    running = session.current_scores["running"]
+    meta = {k: v for k, v in session.model_dump().items() if k != "turn_history"}
+    encoded_meta = _encode_fields(meta)
+    encoded_turns = [serialization.dumps(t) for t in history]
+    last_input = history[-1]["user_input"]
+
+    cases = [
+        ("score_conversation (full rescan)", lambda: score_conversation(history, VOCAB), 200),
+        ("score_from_running", lambda: score_from_running(running, VOCAB), 20000),
+        ("update_running_scores (one turn)", lambda: update_running_scores(running, last_input, VOCAB), 20000),
+        ("session encode (meta + turns)", lambda: (_encode_fields(meta), [serialization.dumps(t) for t in history]), 500),
+        ("session decode + validate", lambda: Session.model_validate({**_decode_fields(encoded_meta), "turn_history": [serialization.loads(t) for t in encoded_turns]}), 500),
+        ("turn encode (dumps_model)", lambda: serialization.dumps_model(TurnData.model_validate(history[-1])), 20000),
+        ("parse_numbered_list (bubbles)", lambda: parse_numbered_list(BUBBLE_REPLY), 50000),
+    ]
+
+    print(f"{args.turns}-turn session, serializer={serialization.SESSION_SERIALIZER}")
+    results = {}
+    for name, fn, number in cases:
+        seconds = bench(fn, number)
+        results[name] = {"us_per_call": round(seconds * 1e6, 2), "calls_per_second": round(1 / seconds)}
+        print(f"  {name:<36} {seconds * 1e6:10.2f} us  {1 / seconds:12,.0f}/s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Compares the compiled phrase matcher against the per-word scans scoring used before.
+# Run with: python -m backend.benchmarks.bench_phrase_matcher [turns] [vocab_size]
+import random
+import sys
+import timeit
+
+from backend.utils.phrase_matcher import compile_matcher
+
+BASE_VOCAB = ["please", "thank you", "have a good day!", "appointment", "concern", "you know"]
+FILLER = ["um", "uh", "like", "so", "well", "hmm", "I", "would", "want", "a", "the", "table", "today"]
+
+def make_transcript(turns: int, seed: int = 7):
+    rng = random.Random(seed)
+    words = FILLER + [w for phrase in BASE_VOCAB for w in phrase.split()]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(5, 40))) + "." for _ in range(turns)]
+
+def make_vocab(size: int):
+    extra = [f"term{i}" for i in range(max(size - len(BASE_VOCAB), 0))]
+    return (BASE_VOCAB + extra)[:size]
+
+def substring_loop(turns, vocab):
+    # models/scoring.py before: one lowercase substring scan per vocab word per turn
+    return sum(sum(1 for word in vocab if word.lower() in text.lower()) for text in turns)
+
+def token_set_loop(turns, vocab):
+    # services/scoring.py before: the lowercased vocab set rebuilt for every word
+    return sum(
+        1 for text in turns
+        for w in text.lower().split()
+        if w in {vf.lower() for vf in vocab}
+    )
+
+def matcher_pass(turns, vocab):
+    matcher = compile_matcher(vocab)
+    return sum(matcher.total(text) for text in turns)
+
+def main():
+    n_turns = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    vocab_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    turns = make_transcript(n_turns)
+    vocab = make_vocab(vocab_size)
+
+    print(f"{n_turns} turns, {vocab_size} vocab phrases")
+    for name, fn in [("substring_loop", substring_loop), ("token_set_loop", token_set_loop), ("phrase_matcher", matcher_pass)]:
+        runs = 5
+        seconds = min(timeit.repeat(lambda: fn(turns, vocab), number=1, repeat=runs))
+        print(f"  {name:<16} {seconds * 1000:9.2f} ms  hits={fn(turns, vocab)}")
+
+if __name__ == "__main__":
+    main()
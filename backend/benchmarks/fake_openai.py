@@ -0,0 +1,206 @@
+# A stand-in for the OpenAI endpoints the backend uses (chat, streaming chat,
+# transcription, speech, realtime sessions), with configurable latency, so load tests never hit the real API.
+# Run with: python -m backend.benchmarks.fake_openai [--port 8765] [--latency gpt-5=lognormal:2:0.4 ...]
+# then point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import struct
+import time
+import uuid
+import wave
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+class Latency:
+    # "fixed:S", "uniform:LO:HI" or "lognormal:MEDIAN:SIGMA", all in seconds
+    def __init__(self, spec: str):
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution '{spec}'")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(self.params[0], self.params[1])
+        median, sigma = self.params
+        return random.lognormvariate(math.log(median), sigma)
+
+# rough production shapes; time to first token for chat, whole call otherwise
+DEFAULT_LATENCY = {
+    "gpt-4o": "lognormal:0.6:0.35",
+    "gpt-4o-mini": "lognormal:0.4:0.3",
+    "gpt-5": "lognormal:2.0:0.4",
+    "gpt-4o-transcribe": "lognormal:0.5:0.3",
+    "gpt-4o-mini-tts": "lognormal:0.3:0.3",
+    "default": "lognormal:0.5:0.3",
+}
+TOKEN_INTERVAL_SECONDS = 0.015
+
+REPLIES = [
+    "That sounds great, could you tell me a little more about what you need?",
+    "Of course! What time would work best for you?",
+    "I understand. Have you tried anything else so far?",
+    "Perfect, and how many people will be joining you today?",
+]
+
+SUGGESTIONS = [
+    "Could you recommend something popular here?",
+    "I'd like to book it for tomorrow evening, please.",
+    "Thank you, that would be really helpful.",
+    "Sorry, could you repeat that more slowly?",
+]
+
+def create_app(latency: Optional[Dict[str, str]] = None, token_interval: float = TOKEN_INTERVAL_SECONDS) -> FastAPI:
+    models = {name: Latency(spec) for name, spec in {**DEFAULT_LATENCY, **(latency or {})}.items()}
+    stats = {"requests": 0, "by_model": {}}
+    app = FastAPI(title="Fake OpenAI")
+
+    async def delay(model: str):
+        stats["requests"] += 1
+        stats["by_model"][model] = stats["by_model"].get(model, 0) + 1
+        await asyncio.sleep(models.get(model, models["default"]).sample())
+
+    def chat_content(body: dict) -> str:
+        prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({
+                "category": "Dining",
+                "description": "You are at a busy neighbourhood cafe at lunchtime. The server is ready to take your order.",
+                "role": "Customer",
+                "objectives": ["Order a meal", "Ask about ingredients"],
+                "vocabulary_focus": ["menu", "recommend", "allergy", "could I have", "the bill"],
+            })
+        if "numbered list" in prompt:
+            return "\n".join(f"{i}. {s}" for i, s in enumerate(SUGGESTIONS, 1))
+        if "running summary" in prompt:
+            return "The learner is ordering food and has asked about the menu."
+        return random.choice(REPLIES)
+
+    def completion(model: str, content: str) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": len(content.split()), "total_tokens": 100 + len(content.split())},
+        }
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "default")
+        content = chat_content(body)
+        await delay(model)
+
+        if not body.get("stream"):
+            return JSONResponse(completion(model, content))
+
+        async def events():
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for i, word in enumerate(content.split(" ")):
+                yield chunk(completion_id, model, {"content": word if i == 0 else " " + word})
+                await asyncio.sleep(token_interval)
+            yield chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        await delay(str(form.get("model", "default")))
+        return JSONResponse({"text": "I would like a table for two, please."})
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        model = body.get("model", "default")
+        response_format = body.get("response_format", "mp3")
+        await delay(model)
+
+        # ~60 ms of 24 kHz audio per character, generated in 100 ms chunks
+        pcm = fake_pcm(len(body.get("input", "")) * 0.06)
+        audio = pcm_to_wav(pcm) if response_format == "wav" else pcm
+
+        async def chunks():
+            step = 4800
+            for start in range(0, len(audio), step):
+                yield audio[start:start + step]
+                await asyncio.sleep(token_interval)
+
+        return StreamingResponse(chunks(), media_type="application/octet-stream")
+
+    @app.post("/v1/realtime/sessions")
+    async def realtime_sessions(request: Request):
+        body = await request.json()
+        model = body.get("model", "default")
+        await delay(model)
+        return JSONResponse({
+            "id": f"sess_{uuid.uuid4().hex}",
+            "object": "realtime.session",
+            "model": model,
+            "client_secret": {"value": f"ek_{uuid.uuid4().hex}", "expires_at": int(time.time()) + 60},
+        })
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+def fake_pcm(seconds: float, sample_rate: int = 24000) -> bytes:
+    n = max(int(seconds * sample_rate), 1)
+    return struct.pack(f"<{n}h", *(int(3000 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(n)))
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = 24000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+def parse_latency_args(specs) -> Dict[str, str]:
+    latency = {}
+    for spec in specs or []:
+        model, _, dist = spec.partition("=")
+        Latency(dist)
+        latency[model] = dist
+    return latency
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", action="append", metavar="MODEL=DIST",
+                        help="e.g. gpt-5=lognormal:2:0.4, gpt-4o=fixed:0.2, default=uniform:0.1:0.3")
+    parser.add_argument("--token-interval", type=float, default=TOKEN_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(parse_latency_args(args.latency), args.token_interval), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
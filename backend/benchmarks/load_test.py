@@ -0,0 +1,234 @@
+# Drives /sessions -> many /turn -> /score against the backend with the fake OpenAI
+# server and reports p50/p95/p99 latency and requests/sec per endpoint.
+#
+# In-process (default): imports backend.app with fakeredis (or a local redis-server with
+# --redis local) and starts the fake OpenAI server in a background thread; fakeredis comes
+# from requirements-bench.txt.
+#   python -m backend.benchmarks.load_test --sessions 200 --turns 8 --concurrency 50
+# Against a running deployment that already points at a fake OpenAI server:
+#   python -m backend.benchmarks.load_test --url http://127.0.0.1:8000
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from backend.benchmarks.fake_openai import create_app, fake_pcm, parse_latency_args, pcm_to_wav
+from backend.utils.metrics import percentile
+
+USER_LINES = [
+    "Hi, could I see the menu please?",
+    "I would like to book a table for two tonight.",
+    "Um, what do you recommend?",
+    "Thank you, that sounds good.",
+    "Do you have anything without nuts? I have an allergy.",
+    "Could I have the bill, please?",
+]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        self.latencies[label].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[label] += 1
+            return None
+        return response
+
+    async def stream(self, client: httpx.AsyncClient, label: str, url: str, **kwargs) -> bool:
+        # records time to first delta under "<label> (first byte)" as well as the full stream
+        started = time.perf_counter()
+        first = None
+        try:
+            async with client.stream("POST", url, **kwargs) as response:
+                if response.status_code >= 400:
+                    self.errors[label] += 1
+                    return False
+                async for _ in response.aiter_bytes():
+                    if first is None:
+                        first = time.perf_counter() - started
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return False
+        self.latencies[label].append(time.perf_counter() - started)
+        if first is not None:
+            self.latencies[f"{label} (first byte)"].append(first)
+        return True
+
+    def report(self, elapsed: float) -> List[dict]:
+        rows = []
+        for label in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[label])
+            rows.append({
+                "endpoint": label,
+                "count": len(values),
+                "errors": self.errors[label],
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round((values[-1] if values else 0.0) * 1000, 1),
+                "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+            })
+        return rows
+
+async def run_session(client: httpx.AsyncClient, rec: Recorder, args, rng: random.Random, wav_bytes: bytes):
+    response = await rec.request(client, "POST /sessions", "POST", "/sessions", json={
+        "difficulty": rng.choice(["easy", "medium", "hard"]),
+        "duration_seconds": 3600,
+        "prewarm_opening": args.prewarm_opening,
+    })
+    if response is None:
+        return
+    session_id = response.json()["session_id"]
+
+    for _ in range(args.turns):
+        body = {"session_id": session_id, "user_input": rng.choice(USER_LINES), "defer_bubbles": args.defer_bubbles}
+        if args.audio:
+            await rec.request(client, "POST /transcribe", "POST", "/transcribe", files={"file": ("turn.wav", wav_bytes, "audio/wav")})
+        if rng.random() < args.stream_ratio:
+            await rec.stream(client, "POST /turn/stream", "/turn/stream", json=body)
+        else:
+            await rec.request(client, "POST /turn", "POST", "/turn", json=body)
+        if args.audio:
+            await rec.stream(client, "POST /speak/stream", "/speak/stream?format=pcm", json={"text": rng.choice(USER_LINES)})
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+    await rec.request(client, "GET /sessions/{id}/score", "GET", f"/sessions/{session_id}/score")
+    await rec.request(client, "POST /sessions/{id}/score", "POST", f"/sessions/{session_id}/score")
+
+async def run_load(client: httpx.AsyncClient, args) -> dict:
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    wav_bytes = pcm_to_wav(fake_pcm(2.0, 16000), 16000)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await run_session(client, rec, args, random.Random(rng.random() + i), wav_bytes)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(args.sessions)])
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for label, v in rec.latencies.items() if not label.endswith("(first byte)"))
+    return {"elapsed_seconds": round(elapsed, 2), "total_rps": round(total / elapsed, 1), "endpoints": rec.report(elapsed)}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_fake_openai(latency: Dict[str, str], token_interval: float) -> str:
+    # uvicorn in a daemon thread, so streamed chat and speech behave like the real network path
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(latency, token_interval), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Fake OpenAI server did not start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+def load_app(args):
+    # configure the backend before it is imported: it builds its services at import time
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    if args.openai_asgi:
+        # no sockets: the shared HTTP client calls the fake app directly. httpx buffers ASGI
+        # responses, so streamed endpoints only show their full time, not first byte
+        from backend.utils import http_client
+
+        os.environ["OPENAI_BASE_URL"] = "http://fake-openai/v1"
+        fake = create_app(parse_latency_args(args.latency), args.token_interval)
+        http_client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), timeout=120)
+    else:
+        os.environ["OPENAI_BASE_URL"] = args.openai_url or start_fake_openai(parse_latency_args(args.latency), args.token_interval)
+    # the scheduler's production rate limits would dominate the numbers; set these to reproduce them
+    os.environ.setdefault("OPENAI_RATE_PER_SECOND", "0")
+    os.environ.setdefault("OPENAI_MAX_QUEUE", "100000")
+    os.environ.setdefault("SCENARIO_POOL_WARM", "0")
+
+    if args.redis == "fake":
+        import fakeredis
+        from backend.utils import redis_client
+
+        server = fakeredis.FakeServer()
+        redis_client.init_redis = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    from backend.app import app
+    return app
+
+async def run_in_process(args) -> dict:
+    app = load_app(args)
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=120) as client:
+            result = await run_load(client, args)
+            result["openai_scheduler"] = (await client.get("/debug/openai-scheduler")).json()
+            result["redis_round_trips"] = (await client.get("/debug/redis-round-trips")).json()
+    return result
+
+async def run_remote(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limits) as client:
+        return await run_load(client, args)
+
+def print_report(result: dict):
+    print(f"\n{result['elapsed_seconds']}s wall, {result['total_rps']} req/s overall\n")
+    header = f"{'endpoint':<34}{'count':>7}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in result["endpoints"]:
+        print(
+            f"{row['endpoint']:<34}{row['count']:>7}{row['errors']:>7}{row['p50_ms']:>10}"
+            f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}{row['rps']:>8}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the Semantics backend")
+    parser.add_argument("--url", help="test a running backend instead of importing it in-process")
+    parser.add_argument("--openai-url", help="use an already running fake OpenAI server (…/v1)")
+    parser.add_argument("--openai-asgi", action="store_true",
+                        help="call the fake OpenAI app in-process instead of over a local socket")
+    parser.add_argument("--redis", choices=["fake", "local"], default="fake",
+                        help="fakeredis, or the redis-server from REDIS_HOST/REDIS_PORT")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="fraction of turns sent to /turn/stream")
+    parser.add_argument("--defer-bubbles", action="store_true")
+    parser.add_argument("--prewarm-opening", action="store_true")
+    parser.add_argument("--audio", action="store_true", help="also /transcribe and /speak/stream each turn")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max random pause between turns (s)")
+    parser.add_argument("--latency", action="append", metavar="MODEL=DIST", help="fake OpenAI latency, see fake_openai")
+    parser.add_argument("--token-interval", type=float, default=0.015)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_remote(args) if args.url else run_in_process(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 from typing import List, Dict, Any
 from backend.models.session import ScoreMetrics
 from backend.models.feedback import FeedbackResponse
+from backend.utils.phrase_matcher import compile_matcher, normalize_tokens
 
 def score_conversation(turn_history: List[Dict], scenario_vocab: List[str]) -> Dict[str, Any]: 
 
-    FILLER_WORDS = {"um", "uh", "like", "you know", "so", "well", "hmm"}
+    FILLER_WORDS = ("um", "uh", "like", "you know", "so", "well", "hmm")
+    filler_matcher = compile_matcher(FILLER_WORDS)
+    vocab_matcher = compile_matcher(scenario_vocab)
 
     total_turns = len(turn_history)
     if total_turns == 0:
@@ -27,11 +30,11 @@ def score_conversation(turn_history: List[Dict], scenario_vocab: List[str]) -> D
     for turn in turn_history:
         user_input = turn.get("user_input", "").strip()
         all_text.append(user_input)
-        tokens = user_input.lower().split()
+        tokens = normalize_tokens(user_input)
         num_tokens = len(tokens)
         total_tokens += num_tokens
 
-        filler_count = sum(1 for t in tokens if t in FILLER_WORDS)
+        filler_count = sum(1 for _ in filler_matcher.iter_matches(tokens))
         total_filler_count += filler_count
         filler_ratio = filler_count / max(num_tokens, 1)
 
@@ -42,7 +45,7 @@ def score_conversation(turn_history: List[Dict], scenario_vocab: List[str]) -> D
         clarity_score += min(num_tokens / 20.0, 1.0) - min(filler_ratio, 0.5)
         clarity_score = max(clarity_score, 0.0)
 
-        vocab_hits = sum(1 for word in scenario_vocab if word.lower() in user_input.lower())
+        vocab_hits = len(set(vocab_matcher.iter_matches(tokens)))
         total_vocab_hits += vocab_hits
         vocab_score += min(vocab_hits / max(len(scenario_vocab), 1), 1.0)
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 from datetime import time
 
@@ -15,6 +15,14 @@ class Session(BaseModel):
     duration_seconds: int
     status: str = "active"
     final_feedback: Optional[dict] = None
+    history_summary: str = "" #rolling summary of turns that no longer go into the prompt verbatim
+    summarized_turns: int = 0 #how many turns from the start are folded into history_summary
+    opening: Optional[dict] = None #pre-generated opening line + bubbles: {"status", "ai_response", "bubble_suggestions"}
+    turns_offset: int = Field(default=0, exclude=True) #windowed loads: how many turns before turn_history[0] were not read; never stored
+
+    @property
+    def turn_count(self) -> int:
+        return self.turns_offset + len(self.turn_history)
 
 class TurnData(BaseModel):
     turn_number: int
@@ -0,0 +1,140 @@
+import os
+import struct
+from io import BytesIO
+from math import gcd
+
+import numpy as np
+from pydantic import BaseModel
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+TARGET_SAMPLE_RATE = 16000
+FRAME_MS = 20
+# frames quieter than this (RMS, full scale = 1.0; ~-46 dBFS) never count as speech
+VAD_MIN_RMS = float(os.getenv("VAD_MIN_RMS", "0.005"))
+# frames below this fraction of the loudest frame are treated as silence
+VAD_RELATIVE_THRESHOLD = float(os.getenv("VAD_RELATIVE_THRESHOLD", "0.05"))
+# speech kept on either side of the detected region so word onsets are not clipped
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+# what scipy's WAV reader raises on truncated/corrupt files or unsupported formats
+# (a short header surfaces as struct.error, a missing fmt chunk as UnboundLocalError)
+WAV_DECODE_ERRORS = (ValueError, EOFError, struct.error, UnboundLocalError)
+
+class PreprocessedAudio(BaseModel):
+    audio: bytes
+    filename: str
+    processed: bool #false when the upload was passed through untouched
+    is_silent: bool = False
+    original_bytes: int
+    processed_bytes: int
+    sample_rate: int = 0
+    duration_seconds: float = 0.0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+def is_wav(audio_bytes: bytes) -> bool:
+    return len(audio_bytes) >= 12 and audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE"
+
+def to_mono_float(samples: np.ndarray) -> np.ndarray:
+    if samples.dtype == np.int16:
+        audio = samples.astype(np.float32) / 32768.0
+    elif samples.dtype == np.int32:
+        audio = samples.astype(np.float32) / 2147483648.0
+    elif samples.dtype == np.uint8:
+        audio = (samples.astype(np.float32) - 128.0) / 128.0
+    else:
+        audio = samples.astype(np.float32, copy=False)
+
+    if audio.ndim == 2:
+        audio = audio.mean(axis=1)
+    return audio
+
+def resample(audio: np.ndarray, source_rate: int, target_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    if source_rate == target_rate:
+        return audio
+    divisor = gcd(source_rate, target_rate)
+    return resample_poly(audio, target_rate // divisor, source_rate // divisor).astype(np.float32, copy=False)
+
+def speech_bounds(audio: np.ndarray, sample_rate: int):
+    # energy VAD: RMS over fixed frames, speech = frames above an absolute floor and
+    # a fraction of the loudest frame; returns (start, end) sample indices or None
+    frame = max(int(sample_rate * FRAME_MS / 1000), 1)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return None
+
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    threshold = max(VAD_MIN_RMS, float(rms.max()) * VAD_RELATIVE_THRESHOLD)
+    voiced = np.flatnonzero(rms >= threshold)
+    if voiced.size == 0:
+        return None
+
+    padding = int(sample_rate * VAD_PADDING_MS / 1000)
+    start = max(int(voiced[0]) * frame - padding, 0)
+    end = min((int(voiced[-1]) + 1) * frame + padding, len(audio))
+    return start, end
+
+def preprocess_audio(audio_bytes: bytes, filename: str) -> PreprocessedAudio:
+    # Only WAV can be decoded without ffmpeg; anything else (e.g. the app's webm) goes through as-is.
+    passthrough = PreprocessedAudio(
+        audio=audio_bytes,
+        filename=filename,
+        processed=False,
+        original_bytes=len(audio_bytes),
+        processed_bytes=len(audio_bytes),
+    )
+    if not is_wav(audio_bytes):
+        return passthrough
+
+    try:
+        source_rate, samples = wavfile.read(BytesIO(audio_bytes))
+        audio = resample(to_mono_float(samples), source_rate)
+    except WAV_DECODE_ERRORS:
+        # truncated/corrupt WAV or a sample format scipy can't read: let the transcriber try it
+        return passthrough
+
+    bounds = speech_bounds(audio, TARGET_SAMPLE_RATE)
+    if bounds is None:
+        return PreprocessedAudio(
+            audio=b"",
+            filename=filename,
+            processed=True,
+            is_silent=True,
+            original_bytes=len(audio_bytes),
+            processed_bytes=0,
+            sample_rate=TARGET_SAMPLE_RATE,
+        )
+
+    start, end = bounds
+    trimmed = audio[start:end]
+    pcm = (np.clip(trimmed, -1.0, 1.0) * 32767.0).astype(np.int16)
+
+    out = BytesIO()
+    wavfile.write(out, TARGET_SAMPLE_RATE, pcm)
+    encoded = out.getvalue()
+
+    # never send more than the client uploaded
+    if len(encoded) >= len(audio_bytes):
+        return PreprocessedAudio(
+            audio=audio_bytes,
+            filename=filename,
+            processed=False,
+            original_bytes=len(audio_bytes),
+            processed_bytes=len(audio_bytes),
+            sample_rate=source_rate,
+            duration_seconds=round(len(audio) / TARGET_SAMPLE_RATE, 3),
+        )
+
+    base, _ = os.path.splitext(filename or "speech")
+    return PreprocessedAudio(
+        audio=encoded,
+        filename=f"{base}.wav",
+        processed=True,
+        original_bytes=len(audio_bytes),
+        processed_bytes=len(encoded),
+        sample_rate=TARGET_SAMPLE_RATE,
+        duration_seconds=round(len(pcm) / TARGET_SAMPLE_RATE, 3),
+    )
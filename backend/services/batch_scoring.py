@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import ValidationError
+
+from backend.models.session import Session
+from backend.services.scoring import ScoreMetrics, score_conversation
+from backend.utils.phrase_matcher import compile_matcher
+from backend.utils.metrics import timed
+
+# Batch version of services.scoring.score_conversation for re-scoring many finished
+# sessions. Turns are tokenized once into flat per-turn arrays tagged with their
+# session index; per-session totals and every ScoreMetrics field are then array ops.
+# Results are identical to score_conversation (same float operations, same rounding).
+
+def tokenize_sessions(sessions: List[Tuple[List[Dict[str, Any]], List[str]]]) -> Dict[str, np.ndarray]:
+    # one pass over every turn of every session; the trie matcher is compiled once per
+    # distinct vocabulary list, so its per-turn cost doesn't grow with the vocabulary size
+    session_index, word_counts, vocab_hits, has_input = [], [], [], []
+
+    for i, (turn_history, vocab_focus) in enumerate(sessions):
+        vocab_matcher = compile_matcher(vocab_focus) if vocab_focus else None
+        for t in turn_history:
+            text = t.get("user_input")
+            session_index.append(i)
+            if not text:
+                has_input.append(False)
+                word_counts.append(0)
+                vocab_hits.append(0)
+                continue
+            text = str(text)
+            has_input.append(True)
+            word_counts.append(len(text.split()))
+            vocab_hits.append(vocab_matcher.total(text) if vocab_matcher else 0)
+
+    return {
+        "session_index": np.asarray(session_index, dtype=np.int64),
+        "has_input": np.asarray(has_input, dtype=bool),
+        "word_counts": np.asarray(word_counts, dtype=np.int64),
+        "vocab_hits": np.asarray(vocab_hits, dtype=np.int64),
+    }
+
+def _int_bincount(index: np.ndarray, values: np.ndarray, n_sessions: int) -> np.ndarray:
+    # integer scatter-add keeps the per-session totals exact
+    totals = np.zeros(n_sessions, dtype=np.int64)
+    np.add.at(totals, index, values)
+    return totals
+
+@timed("scoring", "batch_score_sessions")
+def score_sessions(sessions: List[Tuple[List[Dict[str, Any]], List[str]]]) -> List[Dict[str, Any]]:
+    n_sessions = len(sessions)
+    if n_sessions == 0:
+        return []
+
+    arrays = tokenize_sessions(sessions)
+    index = arrays["session_index"]
+    user_mask = arrays["has_input"]
+
+    n_turns = _int_bincount(index, user_mask.astype(np.int64), n_sessions)
+    total_words = _int_bincount(index, arrays["word_counts"], n_sessions)
+    vocab_used = _int_bincount(index, arrays["vocab_hits"], n_sessions)
+
+    avg_words = total_words.astype(np.float64) / np.maximum(1, n_turns)
+    naturalness = np.minimum(10.0, 5.0 + (avg_words / 5.0))
+    clarity = np.minimum(10.0, 6.0 + (n_turns * 0.4))
+    vocabulary = np.minimum(10.0, 4.0 + (vocab_used * 0.5))
+    pace = np.full(n_sessions, 7.0)
+    overall = (naturalness + clarity + vocabulary + pace) / 4.0
+
+    results = []
+    for i, (_, vocab_focus) in enumerate(sessions):
+        if n_turns[i] == 0:
+            results.append(score_conversation([], vocab_focus))
+            continue
+
+        # Python's round() (not np.round) so the last digit matches score_conversation
+        metrics = ScoreMetrics(
+            overall_score=round(float(overall[i]), 1),
+            naturalness=round(float(naturalness[i]), 1),
+            clarity=round(float(clarity[i]), 1),
+            vocabulary=round(float(vocabulary[i]), 1),
+            pace=round(float(pace[i]), 1),
+        )
+
+        suggestions = []
+        if avg_words[i] < 6:
+            suggestions.append("Try speaking in slightly longer sentences.")
+        if vocab_used[i] == 0 and vocab_focus:
+            suggestions.append("Work in a few of the target vocabulary words.")
+        suggestions.append("Great job keeping the conversation going!")
+
+        results.append({"metrics": metrics, "feedback_messages": [{"suggestions": suggestions}]})
+
+    return results
+
+def _validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in err['loc']) or 'session'}: {err['msg']}" for err in e.errors())
+
+def score_session_dicts(sessions: List[Optional[dict]]) -> List[Optional[Dict[str, Any]]]:
+    # None (not found) stays None; a session that doesn't validate gets {"error": ...}
+    # so one malformed entry can't fail the rest of the batch
+    results: List[Optional[Dict[str, Any]]] = [None] * len(sessions)
+    valid = []
+    for i, data in enumerate(sessions):
+        if data is None:
+            continue
+        try:
+            session = Session.model_validate(data)
+        except ValidationError as e:
+            results[i] = {"error": _validation_error(e)}
+            continue
+        vocab_focus = session.context.get("vocabulary_focus") or []
+        if not isinstance(vocab_focus, list) or not all(isinstance(word, str) for word in vocab_focus):
+            results[i] = {"error": "context.vocabulary_focus: Input should be a list of strings"}
+            continue
+        valid.append((i, session.turn_history, vocab_focus))
+
+    scored = score_sessions([(turn_history, vocab_focus) for _, turn_history, vocab_focus in valid])
+    for (i, _, _), result in zip(valid, scored):
+        results[i] = result
+    return results
+
+async def rescore_all(client, batch_size: int = 500, verify: bool = False, out=sys.stdout) -> int:
+    from backend.utils.redis_client import load_sessions, scan_session_ids
+
+    scored_count = 0
+    batch: List[str] = []
+
+    async def flush():
+        nonlocal scored_count
+        sessions = await load_sessions(client, batch)
+        for session_id, session, result in zip(batch, sessions, score_session_dicts(sessions)):
+            if result is None:
+                continue
+            if "error" in result:
+                out.write(json.dumps({"session_id": session_id, "error": result["error"]}) + "\n")
+                continue
+            if verify:
+                expected = score_conversation(session.get("turn_history", []), session.get("context", {}).get("vocabulary_focus", []))
+                if expected["metrics"] != result["metrics"] or expected["feedback_messages"] != result["feedback_messages"]:
+                    raise AssertionError(f"batch score mismatch for session {session_id}")
+            out.write(json.dumps({
+                "session_id": session_id,
+                "metrics": result["metrics"].model_dump(),
+                "feedback_messages": result["feedback_messages"],
+            }) + "\n")
+            scored_count += 1
+        batch.clear()
+
+    async for session_id in scan_session_ids(client, count=batch_size):
+        batch.append(session_id)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return scored_count
+
+async def _main(args):
+    from backend.utils.redis_client import init_redis
+
+    client = init_redis()
+    try:
+        count = await rescore_all(client, batch_size=args.batch_size, verify=args.verify)
+    finally:
+        await client.aclose()
+    print(f"scored {count} sessions", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score every session:* key in Redis with the batch scorer (JSON lines on stdout).")
+    parser.add_argument("--batch-size", type=int, default=500, help="sessions loaded per pipelined round trip")
+    parser.add_argument("--verify", action="store_true", help="cross-check every result against score_conversation")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,89 @@
+import logging
+import math
+import os
+import re
+from typing import List, Set, Tuple
+
+from backend.models.session import Session
+from backend.services.openai_service import OpenAIService
+from backend.utils.call_scheduler import detached_task
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    # offline approximation of BPE token counts for English: one token per word or
+    # punctuation mark, or ~4 characters per token for long words, whichever is larger
+    if not text:
+        return 0
+    return max(len(_TOKEN_PATTERN.findall(text)), math.ceil(len(text) / 4))
+
+def turn_tokens(turn: dict) -> int:
+    return estimate_tokens(turn.get("user_input", "")) + estimate_tokens(turn.get("ai_response", "")) + 4
+
+class HistoryManager:
+    # keeps at least the last keep_turns turns verbatim in the prompt and folds older ones
+    # into a rolling summary stored on the session (history_summary / summarized_turns);
+    # folding waits until fold_batch extra turns have built up so it costs one LLM call per batch
+
+    def __init__(
+            self,
+            session_manager,
+            openai_service: OpenAIService,
+            keep_turns: int = int(os.getenv("HISTORY_KEEP_TURNS", "6")),
+            fold_batch: int = int(os.getenv("HISTORY_FOLD_BATCH", "4")),
+            token_budget: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500")),
+            summary_max_tokens: int = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "250")),
+    ):
+        self.session_manager = session_manager
+        self.openai_service = openai_service
+        self.keep_turns = keep_turns
+        self.fold_batch = max(fold_batch, 1)
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self._folding: Set[str] = set()
+
+    def build_window(self, session: Session) -> Tuple[str, List[dict]]:
+        summary = session.history_summary
+        recent = session.turn_history[max(session.summarized_turns - session.turns_offset, 0):]
+
+        # drop the oldest verbatim turns until summary + window fit the budget
+        used = estimate_tokens(summary) + sum(turn_tokens(t) for t in recent)
+        while recent and used > self.token_budget:
+            used -= turn_tokens(recent[0])
+            recent = recent[1:]
+
+        return summary, recent
+
+    def needs_fold(self, session: Session) -> bool:
+        return session.turn_count - session.summarized_turns >= self.keep_turns + self.fold_batch
+
+    def schedule_fold(self, session: Session):
+        # summarization runs off the request path; the next turn picks up whatever is stored by then
+        if not self.needs_fold(session) or session.session_id in self._folding:
+            return
+        self._folding.add(session.session_id)
+        task = detached_task(self.fold(session))
+        task.add_done_callback(lambda _: self._folding.discard(session.session_id))
+
+    async def fold(self, session: Session):
+        # turn_history may start at turns_offset (a windowed load), which is never past summarized_turns
+        fold_until = session.turn_count - self.keep_turns
+        offset = session.turns_offset
+        to_fold = session.turn_history[max(session.summarized_turns - offset, 0):max(fold_until - offset, 0)]
+        if not to_fold:
+            return
+
+        try:
+            summary = await self.openai_service.summarize_conversation(
+                previous_summary=session.history_summary,
+                turns=to_fold,
+                max_tokens=self.summary_max_tokens
+            )
+            await self.session_manager.update_session(
+                session.session_id,
+                {"history_summary": summary, "summarized_turns": fold_until}
+            )
+        except Exception:
+            logger.exception("History summarization failed for session %s", session.session_id)
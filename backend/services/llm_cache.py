@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict
+
+from backend.utils import metrics
+from backend.utils.redis_client import load_llm_response, save_llm_response
+from backend.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_REQUESTS = metrics.REGISTRY.register(metrics.Counter(
+    "semantics_llm_cache_requests_total",
+    "LLM response cache lookups by kind and result (hit, coalesced, miss, bypass, error).",
+    ("kind", "result")
+))
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+class LLMCache:
+    # Shared Redis cache of LLM replies for calls whose output only depends on the prompt
+    # (thought bubbles for a given AI line, scenario expansion). Keys are a hash of
+    # (model, normalized prompt, CEFR level); entries expire ttl_seconds after their last
+    # use and the least recently used ones are evicted beyond max_entries. Concurrent
+    # misses for the same key within a worker share one upstream call. Redis errors fall
+    # back to calling the model, so the cache can never fail a request.
+
+    def __init__(
+            self,
+            redis_client,
+            ttl_seconds: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600))),
+            max_entries: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000")),
+    ):
+        self.redis = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._flights = SingleFlight()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(model: str, prompt: str, level: str) -> str:
+        return hashlib.sha256("\x00".join([model, level.strip().upper(), normalize_prompt(prompt)]).encode()).hexdigest()
+
+    def _count(self, kind: str, result: str):
+        self._counts[kind][result] += 1
+        LLM_CACHE_REQUESTS.inc(kind=kind, result=result)
+
+    async def get_or_call(self, kind: str, model: str, prompt: str, level: str, call: Callable[[], Awaitable[str]], use_cache: bool = True) -> str:
+        # call() makes the actual request and returns the reply text
+        if not use_cache or not self.enabled:
+            self._count(kind, "bypass")
+            return await call()
+
+        key = self.make_key(model, prompt, level)
+        content, shared = await self._flights.run(key, lambda: self._lookup_or_call(kind, key, call))
+        if shared:
+            self._count(kind, "coalesced")
+        return content
+
+    async def _lookup_or_call(self, kind: str, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        content = await self._lookup(kind, key)
+        if content is None:
+            self._count(kind, "miss")
+            content = await call()
+            await self._store(key, content)
+        return content
+
+    async def _lookup(self, kind: str, key: str):
+        try:
+            content = await load_llm_response(self.redis, key, time.time(), self.ttl_seconds)
+        except Exception:
+            logger.exception("LLM cache lookup failed")
+            self._count(kind, "error")
+            return None
+        if content is not None:
+            self._count(kind, "hit")
+        return content
+
+    async def _store(self, key: str, content: str):
+        try:
+            self.evictions += await save_llm_response(self.redis, key, content, time.time(), self.ttl_seconds, self.max_entries)
+        except Exception:
+            logger.exception("LLM cache store failed")
+
+    def stats(self) -> dict:
+        kinds = {}
+        for kind, counts in self._counts.items():
+            served = counts["hit"] + counts["coalesced"]
+            lookups = served + counts["miss"]
+            kinds[kind] = {
+                **{result: counts[result] for result in ("hit", "coalesced", "miss", "bypass", "error")},
+                "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+            }
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "inflight": len(self._flights),
+            "kinds": kinds,
+        }
@@ -1,22 +1,57 @@
-from typing import List
+import json
+from typing import AsyncIterator, List, Optional
+import httpx
 from backend.models.scenario import ScenarioContext
 from backend.models.feedback import ThoughtBubble
+from backend.utils.http_client import get_http_client
+from backend.utils.call_scheduler import CallScheduler, get_scheduler
+from backend.services.llm_cache import LLMCache
+from backend.utils.metrics import timed
 import openai
 
+TTS_MODEL = "gpt-4o-mini-tts"
+TRANSCRIBE_MODEL = "gpt-4o-transcribe"
+
+def parse_numbered_list(content: str, limit: int = 4) -> List[str]:
+    # "1. foo" / "- foo" lines of a model reply, markers stripped
+    suggestions = []
+    for line in content.strip().split("\n"):
+        line = line.strip()
+        if line and (line[0].isdigit() or line.startswith("-")):
+            cleaned = line.lstrip("0123456789.- ").strip()
+            if cleaned:
+                suggestions.append(cleaned)
+
+    return suggestions[:limit]
+
 class OpenAIService: 
 
-    def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None, scheduler: Optional[CallScheduler] = None, llm_cache: Optional[LLMCache] = None):
+        # AsyncOpenAI on the shared pooled httpx client so LLM and audio calls never block the event loop.
+        # Every call goes through the scheduler (per-model limits, retries, request deadline),
+        # so the SDK's own retries are turned off
+        self.client = openai.AsyncOpenAI(api_key=api_key, http_client=http_client or get_http_client(), max_retries=0)
+        self.scheduler = scheduler or get_scheduler()
+        # optional shared cache for the prompt-determined calls (bubbles, scenario expansion)
+        self.llm_cache = llm_cache
 
-    def generate_ai_response(
+    async def _cached(self, kind: str, model: str, prompt: str, level: str, call, use_cache: bool) -> str:
+        if self.llm_cache is None:
+            return await call()
+        return await self.llm_cache.get_or_call(kind, model, prompt, level, call, use_cache=use_cache)
+
+    def _build_chat_messages(
             self,
             user_input: str,
             scenario: ScenarioContext,
-            conversation_history: List[dict]
-    ) -> str:
+            conversation_history: List[dict],
+            history_summary: str = ""
+    ) -> List[dict]:
         history_text = "\n".join(
             [f"User: {t['user_input']}\nAI: {t['ai_response']}" for t in conversation_history]
         )
+        if history_summary:
+            history_text = f"(Summary of earlier conversation: {history_summary})\n{history_text}"
 
         system_prompt = (
             "You are a friendly conversation partner helping someone practice English. "
@@ -34,18 +69,84 @@ class OpenAIService:
             "Give your next reply now."
         )
 
-        response = self.client.chat.completions.create(
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    @timed("openai")
+    async def generate_ai_response(
+            self,
+            user_input: str,
+            scenario: ScenarioContext,
+            conversation_history: List[dict],
+            history_summary: str = ""
+    ) -> str:
+        response = await self.scheduler.call("gpt-4o", lambda: self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=self._build_chat_messages(user_input, scenario, conversation_history, history_summary),
+            temperature=1,
+        ))
+
+        return response.choices[0].message.content.strip()
+
+    @timed("openai")
+    async def stream_ai_response(
+            self,
+            user_input: str,
+            scenario: ScenarioContext,
+            conversation_history: List[dict],
+            history_summary: str = ""
+    ) -> AsyncIterator[str]:
+        # same prompt as generate_ai_response, but yields content deltas as they arrive
+        messages = self._build_chat_messages(user_input, scenario, conversation_history, history_summary)
+
+        async def deltas():
+            stream = await self.client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                temperature=1,
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+
+        async for delta in self.scheduler.stream("gpt-4o", deltas):
+            yield delta
+
+    @timed("openai")
+    async def generate_opening_line(self, scenario: ScenarioContext) -> str:
+        # the AI's first line, before the learner has said anything
+        system_prompt = (
+            "You are a friendly conversation partner helping someone practice English. "
+            "Stay fully in character for the given scenario. "
+            "Open the conversation in no more than two sentences and end with a question "
+            "that invites the learner to respond."
+        )
+        user_prompt = (
+            f"Scenario: {scenario.description}\n"
+            f"Role: {scenario.role}\n"
+            f"Difficulty: {scenario.difficulty}\n\n"
+            "Start the conversation now."
+        )
+
+        response = await self.scheduler.call("gpt-4o", lambda: self.client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             temperature=1,
-        )
+        ))
 
         return response.choices[0].message.content.strip()
 
-    def generate_thought_bubbles(self, ai_response: str, scenario: ScenarioContext) -> List[str]:
+    @timed("openai")
+    async def generate_thought_bubbles(self, ai_response: str, scenario: ScenarioContext, use_cache: bool = True) -> List[str]:
 
         prompt = f"""
         Assume the role of a language tutor. Based on this response {ai_response}, suggest 4 possible responses that the user could say or 
@@ -53,17 +154,104 @@ class OpenAIService:
         1-2 sentences. Output as a numbered list.
         """
 
-        response = self.client.chat.completions.create(model="gpt-5",  messages=[{"role": "user", "content": prompt}],temperature=1)
+        async def call():
+            response = await self.scheduler.call("gpt-5", lambda: self.client.chat.completions.create(model="gpt-5",  messages=[{"role": "user", "content": prompt}],temperature=1))
+            return response.choices[0].message.content
+
+        content = await self._cached("thought_bubbles", "gpt-5", prompt, scenario.difficulty, call, use_cache)
+        return parse_numbered_list(content, limit=4)
+
+    @timed("openai")
+    async def generate_scenario_details(self, seed: ScenarioContext, prompt: Optional[str] = None, use_cache: bool = True) -> ScenarioContext:
+        # fills in a realistic description, role, objectives and vocabulary for a scenario;
+        # seed supplies category/difficulty (and fallbacks), prompt is a learner's custom request
+        request = (
+            f"The learner asked to practice: {prompt}\n" if prompt
+            else f"Category: {seed.category}\nSuggested learner role: {seed.role}\n"
+        )
+        instructions = (
+            "Design a short role-play scenario for an English learner at CEFR "
+            f"{seed.difficulty}.\n{request}"
+            "Reply with a JSON object with keys: category (a few words), description "
+            "(2-3 sentences setting the scene, addressed to the learner), role (who the "
+            "learner plays), objectives (2-3 short goals), vocabulary_focus (5-8 useful "
+            "words or short phrases)."
+        )
+
+        async def call():
+            response = await self.scheduler.call("gpt-4o-mini", lambda: self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": instructions}],
+                response_format={"type": "json_object"},
+                temperature=1,
+            ))
+            return response.choices[0].message.content
+
+        data = json.loads(await self._cached("scenario_details", "gpt-4o-mini", instructions, seed.difficulty, call, use_cache))
+        return ScenarioContext(
+            category=str(data.get("category") or seed.category) if prompt else seed.category,
+            description=str(data.get("description") or seed.description),
+            role=str(data.get("role") or seed.role),
+            objectives=[str(o) for o in data.get("objectives") or seed.objectives],
+            vocabulary_focus=[str(v) for v in data.get("vocabulary_focus") or seed.vocabulary_focus],
+            difficulty=seed.difficulty,
+        )
+
+    @timed("openai")
+    async def summarize_conversation(self, previous_summary: str, turns: List[dict], max_tokens: int = 250) -> str:
+        turns_text = "\n".join(
+            [f"User: {t['user_input']}\nAI: {t['ai_response']}" for t in turns]
+        )
+        prompt = (
+            "Update the running summary of an English practice conversation. "
+            "Keep names, facts, decisions and open questions; drop small talk. "
+            "Reply with the updated summary only, in a few sentences.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\n"
+            f"New exchanges:\n{turns_text}"
+        )
+
+        response = await self.scheduler.call("gpt-4o-mini", lambda: self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=max_tokens,
+        ))
+
+        return response.choices[0].message.content.strip()
+
+    @timed("openai")
+    async def transcribe(self, filename: str, audio_bytes: bytes) -> str:
+        tr = await self.scheduler.call(TRANSCRIBE_MODEL, lambda: self.client.audio.transcriptions.create(
+            model=TRANSCRIBE_MODEL,
+            file=(filename, audio_bytes)
+        ))
+        return tr.text.strip()
+
+    @timed("openai")
+    async def synthesize_to_file(self, text: str, out_path: str, voice: str = "verse", response_format: str = "wav"):
+        async def synthesize():
+            async with self.client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=response_format,
+            ) as resp:
+                await resp.stream_to_file(out_path)
 
-        content = response.choices[0].message.content.strip()
-        suggestions = []
-        for line in content.split("\n"):
-            line = line.strip()
-            if line and (line[0].isdigit() or line.startswith("-")):
-                cleaned = line.lstrip("0123456789.- ").strip()
-                if cleaned:
-                    suggestions.append(cleaned)
+        await self.scheduler.call(TTS_MODEL, synthesize)
 
-        return suggestions[:4]
-    
+    @timed("openai")
+    async def stream_speech(self, text: str, voice: str = "verse", response_format: str = "wav", chunk_size: int = 4096) -> AsyncIterator[bytes]:
+        # yields audio bytes as the speech API produces them, without touching disk
+        async def chunks():
+            async with self.client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=response_format,
+            ) as resp:
+                async for chunk in resp.iter_bytes(chunk_size):
+                    yield chunk
 
+        async for chunk in self.scheduler.stream(TTS_MODEL, chunks):
+            yield chunk
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+import httpx
+
+from backend.utils.call_scheduler import detached_task
+from backend.utils.http_client import get_http_client
+from backend.utils.metrics import timed
+from backend.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+REALTIME_MODEL = "gpt-4o-realtime-preview"
+# used when the upstream response carries no client_secret.expires_at
+DEFAULT_TOKEN_LIFETIME_SECONDS = 60
+
+class RealtimeMintError(Exception):
+    pass
+
+class RealtimeTokenPool:
+    # Ephemeral realtime sessions minted ahead of time, so /realtime/ephemeral usually
+    # answers from memory: a deque of (expires_at, session) popped in O(1). Each pooled
+    # session is handed out once. A background loop replaces sessions refresh_margin
+    # seconds before they expire and tops the pool back up to size, but only while
+    # clients have asked for one in the last idle_seconds. When the pool is empty,
+    # concurrent requests share a single in-flight upstream call and, unless a pooled
+    # session has arrived by then, its session. That is safe: the client secret only
+    # authorizes opening connections with the pool's fixed model/voice/modalities, each
+    # connection made with it is its own conversation, and it expires within a minute.
+
+    def __init__(
+            self,
+            api_key: Optional[str],
+            http_client: Optional[httpx.AsyncClient] = None,
+            size: int = int(os.getenv("REALTIME_TOKEN_POOL_SIZE", "2")),
+            refresh_margin_seconds: float = float(os.getenv("REALTIME_TOKEN_REFRESH_MARGIN_SECONDS", "15")),
+            idle_seconds: float = float(os.getenv("REALTIME_TOKEN_IDLE_SECONDS", "300")),
+            base_url: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    ):
+        self.api_key = api_key
+        self._http_client = http_client
+        self.size = size
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.idle_seconds = idle_seconds
+        self.url = f"{base_url.rstrip('/')}/realtime/sessions"
+        self.payload = {"model": REALTIME_MODEL, "voice": "verse", "modalities": ["audio", "text"]}
+        self._tokens: Deque[Tuple[float, dict]] = deque()
+        self._flights = SingleFlight()
+        self._maintainer: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._last_demand = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.minted = 0
+        self.expired = 0
+        self.errors = 0
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # the shared keep-alive client unless one was injected
+        return self._http_client or get_http_client()
+
+    @timed("realtime")
+    async def mint(self) -> dict:
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        try:
+            response = await self.http_client.post(self.url, json=self.payload, headers=headers, timeout=10)
+        except httpx.HTTPError as e:
+            self.errors += 1
+            raise RealtimeMintError(f"OpenAI error: {e}") from e
+        if response.status_code >= 400:
+            self.errors += 1
+            raise RealtimeMintError(f"OpenAI error: {response.text}")
+        self.minted += 1
+        return response.json()
+
+    @staticmethod
+    def expires_at(session: dict) -> float:
+        secret = session.get("client_secret") or {}
+        return float(secret.get("expires_at") or time.time() + DEFAULT_TOKEN_LIFETIME_SECONDS)
+
+    def _usable(self, expires_at: float) -> bool:
+        return expires_at - time.time() > self.refresh_margin_seconds
+
+    def _pop_fresh(self) -> Optional[dict]:
+        while self._tokens:
+            expires_at, session = self._tokens.popleft()
+            if self._usable(expires_at):
+                return session
+            self.expired += 1
+        return None
+
+    async def acquire(self) -> dict:
+        self._last_demand = time.monotonic()
+        session = self._pop_fresh()
+        if session is not None:
+            self.hits += 1
+            self._wakeup.set()
+            return session
+
+        try:
+            session, shared = await self._flights.run(None, self._mint_on_demand)
+        finally:
+            self._wakeup.set()
+        if shared:
+            # a refill may have landed while waiting; prefer a session of our own
+            pooled = self._pop_fresh()
+            if pooled is not None:
+                self.hits += 1
+                return pooled
+            self.coalesced += 1
+        return session
+
+    async def _mint_on_demand(self) -> dict:
+        self.misses += 1
+        return await self.mint()
+
+    def start(self):
+        if self.size > 0 and self.api_key and self._maintainer is None:
+            self._maintainer = detached_task(self._maintain())
+
+    async def stop(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            try:
+                await self._maintainer
+            except asyncio.CancelledError:
+                pass
+            self._maintainer = None
+
+    async def _maintain(self):
+        while True:
+            self._wakeup.clear()
+            delay = self.refresh_margin_seconds
+            try:
+                await self._refresh()
+                if self._tokens:
+                    # wake up when the oldest session is about to become unusable
+                    delay = max(self._tokens[0][0] - time.time() - self.refresh_margin_seconds, 1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Realtime token pool refresh failed")
+                delay = 5.0
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self):
+        # drop sessions that are too close to expiry, then top up while there is demand
+        while self._tokens and not self._usable(self._tokens[0][0]):
+            self._tokens.popleft()
+            self.expired += 1
+        if time.monotonic() - self._last_demand > self.idle_seconds:
+            return
+        missing = self.size - len(self._tokens)
+        if missing <= 0:
+            return
+        results = await asyncio.gather(*[self.mint() for _ in range(missing)], return_exceptions=True)
+        for session in results:
+            if not isinstance(session, BaseException):
+                self._tokens.append((self.expires_at(session), session))
+        # keep the soonest-expiring first so popping stays O(1)
+        self._tokens = deque(sorted(self._tokens, key=lambda token: token[0]))
+        failed = [e for e in results if isinstance(e, BaseException)]
+        if failed:
+            raise failed[0]
+
+    def stats(self) -> dict:
+        served = self.hits + self.coalesced + self.misses
+        return {
+            "pooled": len(self._tokens),
+            "size": self.size,
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.coalesced) / served, 4) if served else 0.0,
+            "minted": self.minted,
+            "expired": self.expired,
+            "errors": self.errors,
+            "inflight": len(self._flights) > 0,
+        }
@@ -2,22 +2,24 @@ from typing import List, Optional
 import random
 from backend.models.scenario import ScenarioContext, ScenarioRequest
 
+CATEGORIES = ['restaurant','travel booking','job interview', 'customer service','negotation of transaction']
+OBJECTIVES = ['practice polite requests', 'use relevant vocabulary', 'maintain social conventions', 'ask for instructions']
+ROLES = ['customer', 'assistant', 'owner', 'manager','employee reporting to manager']
+VOCABULARY_FOCUS = ['please','thank you','have a good day!','appointment', 'concern']
+
 class ScenarioGenerator: 
    
-   def generate_random_scenario(self, difficulty: str) -> ScenarioContext:
+   def generate_random_scenario(self, difficulty: str, category: Optional[str] = None) -> ScenarioContext:
         difficulty_to_cefr = {"easy": "A2", "medium": "B1", "hard": "B2"}
         cefr_level = difficulty_to_cefr[difficulty]
 
-        categories = ['restaurant','travel booking','job interview', 'customer service','negotation of transaction']
-        category = random.choice(categories)
+        category = category or random.choice(CATEGORIES)
 
-        objectives = ['practice polite requests', 'use relevant vocabulary', 'maintain social conventions', 'ask for instructions']
-        objective = random.choice(objectives)
+        objective = random.choice(OBJECTIVES)
 
-        roles = ['customer', 'assistant', 'owner', 'manager','employee reporting to manager']
-        role = random.choice(roles)
+        role = random.choice(ROLES)
 
-        vocabulary_focus = ['please','thank you','have a good day!','appointment', 'concern']
+        vocabulary_focus = list(VOCABULARY_FOCUS)
         
         scenario = ScenarioContext(
             category=category, 
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Optional, Set, Tuple
+
+from backend.models.scenario import ScenarioContext
+from backend.services.openai_service import OpenAIService
+from backend.services.scenario_generator import ScenarioGenerator, CATEGORIES
+from backend.utils.call_scheduler import detached_task
+from backend.utils.redis_client import (
+    pop_pooled_scenario, push_pooled_scenarios, pool_size, acquire_lock, release_lock
+)
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+class ScenarioPool:
+    # Ready-made, LLM-enriched scenarios kept in Redis lists keyed by (difficulty, category).
+    # Session creation pops one in O(1); when a list drops below low_water a background
+    # task tops it back up to target. An empty pool falls back to the template generator.
+
+    def __init__(
+            self,
+            redis_client,
+            openai_service: OpenAIService,
+            scenario_generator: Optional[ScenarioGenerator] = None,
+            low_water: int = int(os.getenv("SCENARIO_POOL_LOW_WATER", "3")),
+            target: int = int(os.getenv("SCENARIO_POOL_TARGET", "10")),
+            refill_concurrency: int = int(os.getenv("SCENARIO_POOL_REFILL_CONCURRENCY", "3")),
+            custom_timeout_seconds: float = float(os.getenv("SCENARIO_CUSTOM_TIMEOUT_SECONDS", "8")),
+    ):
+        self.redis = redis_client
+        self.openai_service = openai_service
+        self.scenario_generator = scenario_generator or ScenarioGenerator()
+        self.low_water = low_water
+        self.target = target
+        self.refill_concurrency = max(refill_concurrency, 1)
+        self.custom_timeout_seconds = custom_timeout_seconds
+        self._refilling: Set[Tuple[str, str]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro):
+        task = detached_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def get_scenario(self, difficulty: str, category: Optional[str] = None) -> ScenarioContext:
+        if difficulty not in DIFFICULTIES:
+            # checked before touching Redis so unknown values never create pools, locks or refills
+            raise ValueError(f"Unknown difficulty '{difficulty}'")
+        category = category or random.choice(CATEGORIES)
+        if category not in CATEGORIES:
+            # only known categories are pooled, so arbitrary input can't trigger refills
+            return self.scenario_generator.generate_random_scenario(difficulty=difficulty, category=category)
+
+        data, remaining = await pop_pooled_scenario(self.redis, difficulty, category)
+
+        if remaining < self.low_water:
+            self.schedule_refill(difficulty, category)
+
+        if data is not None:
+            return ScenarioContext.model_validate(data)
+        return self.scenario_generator.generate_random_scenario(difficulty=difficulty, category=category)
+
+    def schedule_refill(self, difficulty: str, category: str):
+        key = (difficulty, category)
+        if key in self._refilling:
+            return
+        self._refilling.add(key)
+        self._spawn(self._refill(difficulty, category))
+
+    def warm(self):
+        # fill every (difficulty, category) pool in the background, e.g. at startup
+        for difficulty in DIFFICULTIES:
+            for category in CATEGORIES:
+                self.schedule_refill(difficulty, category)
+
+    async def _refill(self, difficulty: str, category: str):
+        lock_name = f"scenario_pool:{difficulty}:{category}"
+        try:
+            # one worker refills a given pool at a time
+            if not await acquire_lock(self.redis, lock_name, ttl_seconds=120):
+                return
+            try:
+                missing = self.target - await pool_size(self.redis, difficulty, category)
+                if missing <= 0:
+                    return
+
+                semaphore = asyncio.Semaphore(self.refill_concurrency)
+
+                async def enrich():
+                    async with semaphore:
+                        seed = self.scenario_generator.generate_random_scenario(difficulty=difficulty, category=category)
+                        try:
+                            # the pool wants variety, and seeds repeat, so a cached expansion would be a duplicate
+                            return await self.openai_service.generate_scenario_details(seed, use_cache=False)
+                        except Exception:
+                            logger.exception("Scenario enrichment failed for %s/%s", difficulty, category)
+                            return None
+
+                scenarios = [s for s in await asyncio.gather(*[enrich() for _ in range(missing)]) if s is not None]
+                await push_pooled_scenarios(self.redis, difficulty, category, [s.model_dump() for s in scenarios])
+            finally:
+                await release_lock(self.redis, lock_name)
+        except Exception:
+            logger.exception("Scenario pool refill failed for %s/%s", difficulty, category)
+        finally:
+            self._refilling.discard((difficulty, category))
+
+    async def get_custom_scenario(self, user_input: str) -> ScenarioContext:
+        # expansions go through the LLM response cache (keyed by the normalized prompt),
+        # so a repeated request costs one GET
+        seed = self.scenario_generator.generate_custom_scenario(user_input)
+        try:
+            scenario = await asyncio.wait_for(
+                self.openai_service.generate_scenario_details(seed, prompt=user_input),
+                timeout=self.custom_timeout_seconds
+            )
+        except Exception:
+            logger.exception("Custom scenario expansion failed; using the raw prompt")
+            return seed
+
+        return scenario
@@ -1,5 +1,7 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
+from backend.utils.phrase_matcher import compile_matcher
+from backend.utils.metrics import timed
 
 class ScoreMetrics(BaseModel):
     overall_score: float
@@ -8,10 +10,7 @@ class ScoreMetrics(BaseModel):
     vocabulary: float
     pace: float
 
-def score_conversation(turn_history: List[Dict[str, Any]], vocab_focus: List[str]) -> Dict[str, Any]:
-    user_turns = [t for t in turn_history if t.get("user_input")]
-    n_turns = len(user_turns)
-
+def _build_result(n_turns: int, total_words: int, vocab_used: int, vocab_focus: List[str]) -> Dict[str, Any]:
     if n_turns == 0:
         metrics = ScoreMetrics(
             overall_score=0,
@@ -25,19 +24,7 @@ def score_conversation(turn_history: List[Dict[str, Any]], vocab_focus: List[str
             "feedback_messages": [{"suggestions": ["No input detected. Try saying something next time 😄."]}],
         }
 
-    word_counts = []
-    for t in user_turns:
-        wc = len(str(t.get("user_input", "")).split())
-        word_counts.append(wc)
-    avg_words = sum(word_counts) / max(1, len(word_counts))
-
-    vocab_used = 0
-    if vocab_focus:
-        vocab_used = sum(
-            1 for t in user_turns
-            for w in str(t.get("user_input","")).lower().split()
-            if w in {vf.lower() for vf in vocab_focus}
-        )
+    avg_words = total_words / max(1, n_turns)
 
     naturalness = min(10.0, 5.0 + (avg_words / 5.0))
     clarity = min(10.0, 6.0 + (n_turns * 0.4))
@@ -63,4 +50,58 @@ def score_conversation(turn_history: List[Dict[str, Any]], vocab_focus: List[str
     return {
         "metrics": metrics,
         "feedback_messages": [{"suggestions": suggestions}],
-    }
\ No newline at end of file
+    }
+
+@timed("scoring")
+def score_conversation(turn_history: List[Dict[str, Any]], vocab_focus: List[str]) -> Dict[str, Any]:
+    user_turns = [t for t in turn_history if t.get("user_input")]
+
+    total_words = sum(len(str(t.get("user_input", "")).split()) for t in user_turns)
+
+    # phrase-aware: multi-word vocabulary like "thank you" counts, punctuation is ignored
+    vocab_used = 0
+    if vocab_focus:
+        matcher = compile_matcher(vocab_focus)
+        vocab_used = sum(matcher.total(str(t.get("user_input", ""))) for t in user_turns)
+
+    return _build_result(len(user_turns), total_words, vocab_used, vocab_focus)
+
+# Running aggregates kept in Session.current_scores["running"] and updated once per
+# committed turn, so scoring a session never rescans turn_history.
+
+def empty_running_scores() -> Dict[str, int]:
+    return {
+        "turns_seen": 0,  # every committed turn, including empty input
+        "turns": 0,  # turns with user input (what score_conversation counts)
+        "words": 0,
+        "vocab_hits": 0,
+    }
+
+@timed("scoring")
+def update_running_scores(running: Optional[Dict[str, int]], user_input: str, vocab_focus: List[str]) -> Dict[str, int]:
+    running = dict(running or empty_running_scores())
+    running["turns_seen"] += 1
+
+    if not user_input:
+        return running
+
+    text = str(user_input)
+    words = text.split()
+
+    running["turns"] += 1
+    running["words"] += len(words)
+    if vocab_focus:
+        running["vocab_hits"] += compile_matcher(vocab_focus).total(text)
+    return running
+
+def running_scores_for(turn_history: List[Dict[str, Any]], vocab_focus: List[str]) -> Dict[str, int]:
+    # seeds the aggregates for sessions that have turns from before they were tracked
+    running = empty_running_scores()
+    for t in turn_history:
+        running = update_running_scores(running, t.get("user_input", ""), vocab_focus)
+    return running
+
+@timed("scoring")
+def score_from_running(running: Dict[str, int], vocab_focus: List[str]) -> Dict[str, Any]:
+    # same result as score_conversation over the turns folded into running
+    return _build_result(running["turns"], running["words"], running["vocab_hits"], vocab_focus)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from backend.models.session import Session
+from backend.utils import serialization
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "session-invalidate"
+
+class _Entry:
+    __slots__ = ("session", "version", "expires_at", "size")
+
+    def __init__(self, session: Session, version: int, expires_at: float, size: int):
+        self.session = session
+        self.version = version
+        self.expires_at = expires_at
+        self.size = size
+
+class SessionCache:
+    # Per-worker LRU of decoded sessions, each stamped with the version field its data
+    # was read at. Writes go to Redis first and are then applied to the cached copy, so
+    # the worker that just committed a turn serves the next read without decoding.
+    #
+    # Coherence across workers:
+    #   mode="version": a hit is confirmed with HGET version (one small round trip) and
+    #                   dropped if another worker has written since. Always current.
+    #   mode="pubsub":  hits need no round trip; writers PUBLISH "version:session_id" and
+    #                   every worker drops older copies. Stale for at most ttl_seconds
+    #                   if a message is lost (e.g. while reconnecting).
+
+    def __init__(
+            self,
+            max_entries: int = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "1000")),
+            ttl_seconds: float = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300")),
+            mode: str = os.getenv("SESSION_CACHE_MODE", "version"),
+    ):
+        if mode not in ("version", "pubsub"):
+            raise ValueError(f"Unknown session cache mode '{mode}'")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.mode = mode
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def copy_of(session: Session) -> Session:
+        # callers append to turn_history and reassign fields on their copy; nested
+        # turn dicts are shared and treated as read-only
+        return session.model_copy(update={"turn_history": list(session.turn_history)})
+
+    def get(self, session_id: str) -> Optional[Tuple[Session, int]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._drop(session_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        return entry.session, entry.version
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_stale(self, session_id: str):
+        # a version check found a newer write from elsewhere
+        self.stale += 1
+        self.misses += 1
+        self._drop(session_id)
+
+    def put(self, session_id: str, session: Session, version: Optional[int]):
+        if version is None or self.max_entries <= 0:
+            return
+        self._drop(session_id)
+        size = len(serialization.dumps(session.model_dump()))
+        self._entries[session_id] = _Entry(self.copy_of(session), version, time.monotonic() + self.ttl_seconds, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries:
+            _, oldest = self._entries.popitem(last=False)
+            self._bytes -= oldest.size
+            self.evictions += 1
+
+    def apply(self, session_id: str, version: Optional[int], fields: Optional[dict] = None, append_turn: Optional[dict] = None, set_turn: Optional[Tuple[int, dict]] = None):
+        # write-through: only a copy that was current right before this write can be patched,
+        # anything else is dropped and re-read next time
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        if version is None or entry.version != version - 1:
+            self.invalidate(session_id)
+            return
+
+        update = dict(fields or {})
+        turns = entry.session.turn_history
+        if append_turn is not None:
+            turns = turns + [append_turn]
+        if set_turn is not None:
+            turn_number, turn = set_turn
+            turns = list(turns)
+            turns[turn_number - 1] = turn
+        if turns is not entry.session.turn_history:
+            update["turn_history"] = turns
+
+        entry.session = entry.session.model_copy(update=update)
+        entry.version = version
+        if append_turn is not None:
+            added = len(serialization.dumps(append_turn))
+            entry.size += added
+            self._bytes += added
+
+    def invalidate(self, session_id: str, version: Optional[int] = None):
+        # version: only drop a copy older than it (pub/sub messages include our own writes)
+        entry = self._entries.get(session_id)
+        if entry is None or (version is not None and entry.version >= version):
+            return
+        self.invalidations += 1
+        self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    async def publish(self, redis_client, session_id: str, version: Optional[int]):
+        # version None (e.g. a delete) tells every worker to drop its copy
+        if self.mode != "pubsub":
+            return
+        await redis_client.publish(INVALIDATION_CHANNEL, f"{'*' if version is None else version}:{session_id}")
+
+    def start_listener(self, redis_client):
+        if self.mode == "pubsub" and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(redis_client))
+
+    async def stop_listener(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self, redis_client):
+        while True:
+            try:
+                async with redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # anything written while we were not subscribed may have been missed
+                    self.clear()
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        version, _, session_id = message["data"].partition(":")
+                        self.invalidate(session_id, None if version == "*" else int(version))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Session cache invalidation listener failed; reconnecting")
+                await asyncio.sleep(1)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
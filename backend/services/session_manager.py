@@ -1,74 +1,190 @@
 from datetime import datetime, timedelta
 import uuid 
-from backend.utils.redis_client import save_session, load_session, delete_session
+from typing import Optional
+from backend.utils.redis_client import (
+    save_session, load_session, load_session_window, delete_session, update_session_fields,
+    append_turn, load_turn, set_turn, replace_turns, finalize_session, load_session_version
+)
 from backend.models.session import Session, TurnData
+from backend.services.session_cache import SessionCache
+from backend.utils.serialization import dumps_model
 from backend.models.scenario import ScenarioContext
+from backend.utils.metrics import timed
 
 class SessionManager: 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, cache: Optional[SessionCache] = None):
         self.redis = redis_client
+        # optional per-worker cache of decoded sessions; every write still goes to Redis first
+        self.cache = cache if cache is not None and cache.max_entries > 0 else None
 
-    def create_session(self, user_name: str, difficulty_choice: str, chosen_duration_seconds: int):
+    async def _written(self, session_id: str, version: Optional[int], **changes):
+        # keep this worker's cached copy (and, in pub/sub mode, everyone else's) in step with a
+        # write; without a version the copy is simply dropped
+        if self.cache is None:
+            return
+        self.cache.apply(session_id, version, **changes)
+        await self.cache.publish(self.redis, session_id, version)
+
+    @timed("session_manager")
+    async def create_session(self, user_name: str, difficulty_choice: str, chosen_duration_seconds: int, context: Optional[dict] = None, opening: Optional[dict] = None):
         session_id = str(uuid.uuid4())
         cefr_level = {"easy":"A2","medium":"B1","hard":"B2"}[difficulty_choice]
 
-        scenario = ScenarioContext(
-        category="",
-        description="",
-        role="",
-        objectives=[],
-        vocabulary_focus=[],
-        difficulty=cefr_level
-        )
+        if context is None:
+            scenario = ScenarioContext(
+            category="",
+            description="",
+            role="",
+            objectives=[],
+            vocabulary_focus=[],
+            difficulty=cefr_level
+            )
+            context = scenario.model_dump()
         
         session = Session(
             session_id = session_id,
             user_name = user_name,
             cefr_level = cefr_level,
-            context = scenario.dict(),
+            context = context,
             turn_history = [],
             current_scores = {},
             start_time = datetime.now().isoformat(),
             duration_seconds = chosen_duration_seconds,
             status = "active",
-
+            opening = opening,
         )
         
-        save_session(self.redis, session_id, session.dict())
+        await save_session(self.redis, session_id, session.model_dump())
+        if self.cache is not None:
+            # a fresh hash starts at version 1
+            self.cache.put(session_id, session, 1)
         return session_id
     
-    def get_session(self, session_id: str):
-        data = load_session(self.redis, session_id)
+    async def _cached(self, session_id: str) -> Optional[Session]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(session_id)
+        if cached is None:
+            return None
+        session, version = cached
+        if self.cache.mode == "pubsub" or await load_session_version(self.redis, session_id) == version:
+            self.cache.record_hit()
+            return SessionCache.copy_of(session)
+        self.cache.record_stale(session_id)
+        return None
+
+    @timed("session_manager")
+    async def get_session(self, session_id: str, include_turns: bool = True):
+        # a cached copy may carry turns even when include_turns is False
+        session = await self._cached(session_id)
+        if session is not None:
+            return session
+
+        data = await load_session(self.redis, session_id, include_turns=include_turns)
         if not data: 
             raise Exception("Session not found")
-        return Session(**data)
+        session = Session.model_validate(data)
+        if self.cache is not None and include_turns:
+            self.cache.put(session_id, session, data.get("version"))
+        return session
     
-    def update_session(self, session_id: str, updates: dict):
-        session = self.get_session(session_id)
-        for key, value in updates.items():
-            setattr(session, key, value)
+    @timed("session_manager")
+    async def get_session_window(self, session_id: str) -> Session:
+        # turn_history only holds the turns from summarized_turns on (turns_offset counts the
+        # rest), which is what a new turn needs; a cached copy has them all. Windowed copies
+        # aren't cached since other readers expect the full history
+        session = await self._cached(session_id)
+        if session is not None:
+            return session
 
-        save_session(self.redis, session_id, session.dict())
+        data = await load_session_window(self.redis, session_id)
+        if not data:
+            raise Exception("Session not found")
+        return Session.model_validate(data)
+
+    @timed("session_manager")
+    async def update_session(self, session_id: str, updates: dict):
+        updates = dict(updates)
+        turn_history = updates.pop("turn_history", None)
 
-    def end_session(self, session_id: str):
-        session = self.get_session(session_id)
-        session.status = "ended"
-        save_session(self.redis, session_id, session.dict())
-        delete_session(self.redis, session_id)
+        version = await update_session_fields(self.redis, session_id, updates)
+        if not version:
+            raise Exception("Session not found")
+        if turn_history is not None:
+            await replace_turns(self.redis, session_id, turn_history)
+            # two writes; simpler to re-read than to patch
+            if self.cache is not None:
+                self.cache.invalidate(session_id)
+            version = None
+        await self._written(session_id, version, fields=updates)
+
+    @timed("session_manager")
+    async def append_turn(self, session_id: str, turn: TurnData, check_turn_number: bool = False, updates: Optional[dict] = None) -> int:
+        # with check_turn_number the push only lands if turn.turn_number is still the next slot;
+        # otherwise the negated next free turn number is returned and nothing is written.
+        # updates are session fields written atomically with the turn
+        expected = turn.turn_number if check_turn_number else None
+        turn_count, version = await append_turn(self.redis, session_id, dumps_model(turn), expected_turn_number=expected, fields=updates)
+        if not turn_count:
+            raise Exception("Session not found")
+        if turn_count > 0:
+            stored = turn.model_dump()
+            stored["turn_number"] = turn_count
+            await self._written(session_id, version, fields=updates, append_turn=stored)
+        return turn_count
 
-    def check_session_timeout(self, session_id: str, turn_manager=None): 
-        session = self.get_session(session_id)
+    @timed("session_manager")
+    async def get_turn(self, session_id: str, turn_number: int) -> Optional[dict]:
+        if turn_number < 1:
+            return None
+        return await load_turn(self.redis, session_id, turn_number)
+
+    @timed("session_manager")
+    async def update_turn(self, session_id: str, turn_number: int, updates: dict):
+        turn = await self.get_turn(session_id, turn_number)
+        if turn is None:
+            raise IndexError(f"Turn {turn_number} not found")
+        turn.update(updates)
+        version = await set_turn(self.redis, session_id, turn_number, turn)
+        await self._written(session_id, version or None, set_turn=(turn_number, turn))
+
+    @timed("session_manager")
+    async def finalize_session(self, session_id: str, final_feedback: dict, updates: Optional[dict] = None) -> dict:
+        # stores final_feedback (plus updates) only the first time; every caller gets the stored result
+        stored = await finalize_session(self.redis, session_id, final_feedback, fields=updates)
+        if stored is None:
+            raise Exception("Session not found")
+        await self._written(session_id, None)
+        return stored
+
+    @timed("session_manager")
+    async def end_session(self, session_id: str):
+        await self.update_session(session_id, {"status": "ended"})
+        await delete_session(self.redis, session_id)
+        await self._written(session_id, None)
+
+    def is_expired(self, session: Session) -> bool:
         start_dt = datetime.fromisoformat(session.start_time)
         now = datetime.now()
 
         elapsed = (now - start_dt).total_seconds()
-        
-        if elapsed >= session.duration_seconds:
-            if turn_manager:
-                turn_manager.end_session_feedback(session_id)
-            else: 
-                self.end_session(session_id)
-            return False
-        return True
-    
+        return elapsed >= session.duration_seconds
+
+    async def load_active_session(self, session_id: str, turn_manager=None) -> Optional[Session]:
+        # one round trip loads the metadata and the turns the prompt window needs; the expiry
+        # check then runs on that copy and the caller hands the session on instead of re-reading it
+        session = await self.get_session_window(session_id)
+
+        if session.final_feedback is not None:
+            # already finalized (/end, /score or an earlier expiry): nothing left to do
+            return None
+        if self.is_expired(session):
+            await self._expire(session, turn_manager)
+            return None
+        return session
 
+    async def _expire(self, session: Session, turn_manager=None):
+        if turn_manager:
+            await turn_manager.end_session_feedback(session.session_id, session=session)
+        else: 
+            await self.end_session(session.session_id)
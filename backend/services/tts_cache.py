@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from backend.utils.single_flight import SingleFlight
+
+class TTSCache:
+    # Content-addressed on-disk cache of synthesized speech. Files are named by
+    # hash(text, voice, model, format); an in-memory OrderedDict mirrors the
+    # directory in LRU order so lookups and evictions never touch the disk index.
+    # Entries are served as bytes and file operations run in worker threads.
+
+    def __init__(
+            self,
+            directory: str = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "semantics-tts-cache")),
+            max_bytes: int = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # rebuild LRU order from mtimes so the cache survives restarts
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._total_bytes += size
+        self._discard(self._evict())
+
+    @staticmethod
+    def make_key(text: str, voice: str, model: str, response_format: str) -> str:
+        digest = hashlib.sha256("\x00".join([model, voice, response_format, text]).encode()).hexdigest()
+        return f"{digest}.{response_format}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def temp_path(self, key: str) -> str:
+        # dot-prefixed so a crash mid-write never leaves a file that looks like an entry
+        return os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.part")
+
+    # Blocking file operations; the async methods below run them with asyncio.to_thread.
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+
+    @staticmethod
+    def _promote(tmp_path: str, path: str) -> bytes:
+        # returns the audio produced into tmp_path and moves it into place
+        with open(tmp_path, "rb") as f:
+            data = f.read()
+        os.replace(tmp_path, path)
+        return data
+
+    @staticmethod
+    def _write(tmp_path: str, path: str, data: bytes):
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            TTSCache._discard([tmp_path])
+            raise
+
+    @staticmethod
+    def _discard(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        # hands back the audio rather than a path, so an eviction by a concurrent insert
+        # can't unlink the file before the response has read it
+        if key not in self._index:
+            return None
+        self._index.move_to_end(key)
+        try:
+            return await asyncio.to_thread(self._read, self.path_for(key))
+        except FileNotFoundError:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            return None
+
+    async def lookup(self, key: str) -> Optional[bytes]:
+        # get() that counts a hit; the miss is counted by whichever path then synthesizes
+        data = await self.get(key)
+        if data is not None:
+            self.hits += 1
+        return data
+
+    async def put(self, key: str, data: bytes):
+        await asyncio.to_thread(self._write, self.temp_path(key), self.path_for(key), data)
+        await self._add(key, len(data))
+
+    async def _add(self, key: str, size: int):
+        if key in self._index:
+            self._total_bytes -= self._index.pop(key)
+        self._index[key] = size
+        self._total_bytes += size
+        evicted = self._evict()
+        if evicted:
+            await asyncio.to_thread(self._discard, evicted)
+
+    def _evict(self) -> List[str]:
+        # drops least recently used entries from the index and returns their paths for removal
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            evicted.append(self.path_for(key))
+        return evicted
+
+    async def get_or_create(self, key: str, produce: Callable[[str], Awaitable[None]]) -> bytes:
+        # produce(tmp_path) writes the audio; concurrent misses for the same key share one call
+        data = await self.lookup(key)
+        if data is not None:
+            return data
+
+        data, shared = await self._flights.run(key, lambda: self._create(key, produce))
+        if shared:
+            self.hits += 1
+        return data
+
+    async def _create(self, key: str, produce: Callable[[str], Awaitable[None]]) -> bytes:
+        # an earlier flight for the key may have finished since the caller's lookup
+        data = await self.get(key)
+        if data is not None:
+            return data
+
+        self.misses += 1
+        tmp_path = self.temp_path(key)
+        try:
+            await produce(tmp_path)
+            data = await asyncio.to_thread(self._promote, tmp_path, self.path_for(key))
+        except BaseException:
+            await asyncio.to_thread(self._discard, [tmp_path])
+            raise
+        await self._add(key, len(data))
+        return data
+
+    async def tee(self, key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        # passes chunks through to the caller and stores the audio only if the stream completes
+        self.misses += 1
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        await self.put(key, b"".join(parts))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "inflight": len(self._flights),
+        }
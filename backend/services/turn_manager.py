@@ -1,74 +1,298 @@
+import asyncio
+import logging
+import weakref
 from datetime import datetime
-from typing import List
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-from backend.models.session import TurnData
+from backend.models.session import Session, TurnData
 from backend.models.feedback import ThoughtBubble
 from backend.services.session_manager import SessionManager
 from backend.models.scenario import ScenarioContext
 from backend.services.openai_service import OpenAIService
-from backend.services.scoring import score_conversation
+from backend.services.history_manager import HistoryManager
+from backend.utils.call_scheduler import detached_task
+from backend.services.scoring import ScoreMetrics, score_conversation, update_running_scores, score_from_running, running_scores_for
 
+logger = logging.getLogger(__name__)
 
 class TurnManager: 
-    def __init__(self, session_manager: SessionManager, openai_service: OpenAIService):
+    def __init__(self, session_manager: SessionManager, openai_service: OpenAIService, history_manager: Optional[HistoryManager] = None):
         self.session_manager = session_manager
         self.openai_service = openai_service
+        self.history_manager = history_manager or HistoryManager(session_manager, openai_service)
+        # per-session locks serialize the read-modify-write of turn_history within this worker
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._bubble_tasks: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._opening_tasks: Dict[str, asyncio.Task] = {}
 
-    def process_user_turn(self, session_id, user_input: str) -> TurnData:
-        session = self.session_manager.get_session(session_id)
+    def _lock_for(self, session_id: str) -> asyncio.Lock:
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._session_locks[session_id] = lock
+        return lock
 
-        scenario: ScenarioContext = ScenarioContext(**session.context)
-        
-        ai_response = self.openai_service.generate_ai_response(user_input=user_input, scenario=scenario, conversation_history=session.turn_history)
-        
-        
-        thought_suggestions = self.openai_service.generate_thought_bubbles(ai_response=ai_response, scenario=scenario)
+    async def _build_bubbles(self, ai_response: str, scenario: ScenarioContext) -> List[dict]:
+        thought_suggestions = await self.openai_service.generate_thought_bubbles(ai_response=ai_response, scenario=scenario)
         bubble_objs = [ThoughtBubble(suggestion_text=s, complexity_level=scenario.difficulty) for s in thought_suggestions]
+        return [b.model_dump() for b in bubble_objs]
+
+    async def process_user_turn(self, session_id, user_input: str, defer_bubbles: bool = False, session: Optional[Session] = None) -> TurnData:
+        if session is None:
+            session = await self.session_manager.get_session_window(session_id)
+
+        scenario: ScenarioContext = ScenarioContext.model_validate(session.context)
+
+        opening = await self._opening_for_turn(session, user_input)
+        if opening is not None:
+            return await self._serve_opening(session, opening)
         
+        history_summary, recent_turns = self.history_manager.build_window(session)
+        ai_response = await self.openai_service.generate_ai_response(user_input=user_input, scenario=scenario, conversation_history=recent_turns, history_summary=history_summary)
+
+        return await self._finish_turn(session, user_input, ai_response, scenario, defer_bubbles)
+
+    async def stream_user_turn(self, session_id, user_input: str, defer_bubbles: bool = False, session: Optional[Session] = None) -> AsyncIterator[Tuple[str, Any]]:
+        # yields ("delta", text) for each reply chunk, ("reply", text) once the reply is complete
+        # (before bubbles are generated), then ("turn", TurnData) once the turn is saved
+        if session is None:
+            session = await self.session_manager.get_session_window(session_id)
+
+        scenario: ScenarioContext = ScenarioContext.model_validate(session.context)
+
+        opening = await self._opening_for_turn(session, user_input)
+        if opening is not None:
+            yield "delta", opening["ai_response"]
+            yield "reply", opening["ai_response"]
+            yield "turn", await self._serve_opening(session, opening)
+            return
+
+        history_summary, recent_turns = self.history_manager.build_window(session)
+        parts = []
+        async for delta in self.openai_service.stream_ai_response(user_input=user_input, scenario=scenario, conversation_history=recent_turns, history_summary=history_summary):
+            parts.append(delta)
+            yield "delta", delta
+
+        ai_response = "".join(parts).strip()
+        yield "reply", ai_response
+        turn = await self._finish_turn(session, user_input, ai_response, scenario, defer_bubbles)
+        yield "turn", turn
+
+    async def _finish_turn(self, session: Session, user_input: str, ai_response: str, scenario: ScenarioContext, defer_bubbles: bool) -> TurnData:
+        session_id = session.session_id
+        # bubbles are prompted from the AI reply, so they can only start once it exists;
+        # in deferred mode they run after the turn is committed and /turn returns immediately
+        bubble_suggestions = None
+        if not defer_bubbles:
+            bubble_suggestions = await self._build_bubbles(ai_response, scenario)
+
+        turn = await self._commit_turn(session, user_input, ai_response, bubble_suggestions)
+
+        if defer_bubbles:
+            self._schedule_bubbles(session_id, turn.turn_number, ai_response, scenario)
+
+        session.turn_history.append(turn.model_dump())
+        self.history_manager.schedule_fold(session)
+
+        return turn
+
+    # Speculative opening: with prewarming, POST /sessions starts generating the AI's first
+    # line and its bubbles while the client is still setting up. An empty first /turn then
+    # returns that result as turn 1 instead of calling the model on the request path.
+
+    def start_opening(self, session_id: str, scenario: ScenarioContext):
+        task = detached_task(self._generate_and_store_opening(session_id, scenario))
+        self._opening_tasks[session_id] = task
+        task.add_done_callback(lambda _: self._opening_tasks.pop(session_id, None))
+
+    def cancel_opening(self, session_id: str) -> bool:
+        task = self._opening_tasks.pop(session_id, None)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def _generate_opening(self, scenario: ScenarioContext) -> dict:
+        ai_response = await self.openai_service.generate_opening_line(scenario)
+        bubbles = await self._build_bubbles(ai_response, scenario)
+        return {"status": "ready", "ai_response": ai_response, "bubble_suggestions": bubbles}
+
+    async def _generate_and_store_opening(self, session_id: str, scenario: ScenarioContext) -> Optional[dict]:
+        try:
+            opening = await self._generate_opening(scenario)
+        except Exception:
+            logger.exception("Opening pre-generation failed for session %s", session_id)
+            opening = {"status": "failed"}
+        try:
+            await self.session_manager.update_session(session_id, {"opening": opening})
+        except Exception:
+            # the session ended or expired while the opening was being generated
+            logger.info("Session %s gone before its opening was stored", session_id)
+        return opening if opening["status"] == "ready" else None
+
+    async def _opening_for_turn(self, session: Session, user_input: str) -> Optional[dict]:
+        # only an empty first turn on a prewarmed session is answered with the opening
+        if user_input.strip() or session.turn_count or session.opening is None:
+            return None
+        if session.opening.get("status") == "ready":
+            return session.opening
+
+        task = self._opening_tasks.get(session.session_id)
+        if task is not None:
+            # still running in this worker: wait for it rather than paying for a second call
+            opening = await asyncio.shield(task)
+            if opening is not None:
+                return opening
+        elif session.opening.get("status") == "pending":
+            # started on another worker; it may have landed since the session was loaded
+            stored = (await self.session_manager.get_session(session.session_id, include_turns=False)).opening
+            if stored and stored.get("status") == "ready":
+                return stored
+
+        return await self._generate_opening(ScenarioContext.model_validate(session.context))
+
+    async def _serve_opening(self, session: Session, opening: dict) -> TurnData:
+        turn = await self._commit_turn(session, "", opening["ai_response"], opening.get("bubble_suggestions"))
+        session.turn_history.append(turn.model_dump())
+        return turn
+
+    async def get_opening(self, session_id: str, wait_seconds: float = 0.0) -> dict:
+        task = self._opening_tasks.get(session_id)
+        if task is not None and wait_seconds > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+        session = await self.session_manager.get_session(session_id, include_turns=False)
+        opening = session.opening or {}
+        return {
+            "ready": opening.get("status") == "ready",
+            "pending": session_id in self._opening_tasks,
+            "status": opening.get("status"),
+            "ai_response": opening.get("ai_response"),
+            "bubble_suggestions": opening.get("bubble_suggestions"),
+        }
+
+    async def _commit_turn(self, session: Session, user_input: str, ai_response: str, bubble_suggestions: Optional[List[dict]]) -> TurnData:
+        session_id = session.session_id
+        vocab_focus = session.context.get("vocabulary_focus", [])
         turn = TurnData(
-            turn_number=len(session.turn_history) + 1,
+            turn_number=session.turn_count + 1,
             user_input=user_input,
             ai_response=ai_response,
             timestamp=datetime.now().isoformat(),
             feedback=None,
-            bubble_suggestions=[b.dict() for b in bubble_objs]
+            bubble_suggestions=bubble_suggestions
         )
 
+        # the turn number and running scores come from the session loaded at the start of the
+        # request; the append is a compare-and-push that also stores the updated scores, so it
+        # costs one round trip unless another turn landed first
+        current_scores = session.current_scores
+        if "running" not in current_scores and session.turn_count:
+            # sessions from before the running aggregates: seed them once from the full history
+            turn_history = session.turn_history if not session.turns_offset else (await self.session_manager.get_session(session_id)).turn_history
+            current_scores = {**current_scores, "running": running_scores_for(turn_history, vocab_focus)}
+        async with self._lock_for(session_id):
+            while True:
+                running = update_running_scores(current_scores.get("running"), user_input, vocab_focus)
+                scores = {"running": running}
+                result = await self.session_manager.append_turn(session_id, turn, check_turn_number=True, updates={"current_scores": scores})
+                if result > 0:
+                    break
+                turn.turn_number = -result
+                current_scores = (await self.session_manager.get_session(session_id, include_turns=False)).current_scores
 
-        session.turn_history.append(turn.dict())
-        self.session_manager.update_session(session_id, {"turn_history":session.turn_history})
-
+        session.current_scores = scores
         return turn
-    
-    def get_conversation_context(self, session_id: str) -> List[TurnData]:
-        session = self.session_manager.get_session(session_id)
-        return [TurnData(**turn) for turn in session.turn_history]
 
-    def end_session_feedback(self, session_id: str):
-        session = self.session_manager.get_session(session_id)
-        scenario_vocab = session.context.get("vocabulary_focus", [])
+    def _schedule_bubbles(self, session_id: str, turn_number: int, ai_response: str, scenario: ScenarioContext):
+        key = (session_id, turn_number)
+        task = detached_task(self._generate_and_store_bubbles(session_id, turn_number, ai_response, scenario))
+        self._bubble_tasks[key] = task
+        task.add_done_callback(lambda _: self._bubble_tasks.pop(key, None))
 
-        scored = score_conversation(session.turn_history, scenario_vocab)
+    async def _generate_and_store_bubbles(self, session_id: str, turn_number: int, ai_response: str, scenario: ScenarioContext):
+        try:
+            bubbles = await self._build_bubbles(ai_response, scenario)
+            async with self._lock_for(session_id):
+                await self.session_manager.update_turn(session_id, turn_number, {"bubble_suggestions": bubbles})
+            return bubbles
+        except Exception:
+            logger.exception("Thought bubble generation failed for session %s turn %s", session_id, turn_number)
+            return None
 
-        self.session_manager.update_session(
-            session_id,
-            {
-                "final_feedback": {
-                    "metrics": scored["metrics"].dict(),
-                    "feedback_messages": scored["feedback_messages"]
-                }
-            }
-        )
+    async def get_turn_bubbles(self, session_id: str, turn_number: int, wait_seconds: float = 0.0) -> dict:
+        task = self._bubble_tasks.get((session_id, turn_number))
+        if task is not None and wait_seconds > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=wait_seconds)
+            except asyncio.TimeoutError:
+                pass
 
-        session.status = "ended"
-        self.session_manager.update_session(session_id, {"status": session.status})
+        stored_turn = await self.session_manager.get_turn(session_id, turn_number)
+        if stored_turn is None:
+            raise IndexError(f"Turn {turn_number} not found")
 
+        bubbles = stored_turn.get("bubble_suggestions")
         return {
-            "metrics": scored["metrics"],
-            "feedback_messages": scored["feedback_messages"]
+            "turn_number": turn_number,
+            "ready": bubbles is not None,
+            "pending": (session_id, turn_number) in self._bubble_tasks,
+            "bubble_suggestions": bubbles,
         }
+    
+    async def get_conversation_context(self, session_id: str) -> List[TurnData]:
+        session = await self.session_manager.get_session(session_id)
+        return [TurnData.model_validate(turn) for turn in session.turn_history]
+
+    async def _score(self, session_id: str, session: Optional[Session] = None):
+        # O(1) from the running aggregates; sessions that predate them fall back to a full rescan
+        if session is None:
+            session = await self.session_manager.get_session(session_id, include_turns=False)
+        scenario_vocab = session.context.get("vocabulary_focus", [])
 
+        running = session.current_scores.get("running")
+        if running is not None:
+            return score_from_running(running, scenario_vocab)
 
+        if session.turns_offset or not session.turn_history:
+            session = await self.session_manager.get_session(session_id)
+        return score_conversation(session.turn_history, scenario_vocab)
 
+    async def get_live_scores(self, session_id: str) -> dict:
+        scored = await self._score(session_id)
+        return {
+            "metrics": scored["metrics"].model_dump(),
+            "feedback_messages": scored["feedback_messages"]
+        }
 
+    async def end_session_feedback(self, session_id: str, session: Optional[Session] = None):
+        # finalization happens once: the first caller scores and stores final_feedback with a
+        # compare-and-set, everyone after (/end, /score, expiry checks) gets that stored result
+        if session is None:
+            session = await self.session_manager.get_session(session_id, include_turns=False)
+        if session.final_feedback is not None:
+            return self._feedback_result(session.final_feedback)
 
+        scored = await self._score(session_id, session)
+        updates = {"status": "ended"}
+        if self.cancel_opening(session_id):
+            updates["opening"] = {"status": "cancelled"}
+        stored = await self.session_manager.finalize_session(
+            session_id,
+            {
+                "metrics": scored["metrics"].model_dump(),
+                "feedback_messages": scored["feedback_messages"]
+            },
+            updates
+        )
+        return self._feedback_result(stored)
+
+    @staticmethod
+    def _feedback_result(final_feedback: dict) -> dict:
+        return {
+            "metrics": ScoreMetrics.model_validate(final_feedback["metrics"]),
+            "feedback_messages": final_feedback["feedback_messages"]
+        }
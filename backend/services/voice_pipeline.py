@@ -0,0 +1,201 @@
+import asyncio
+import io
+import re
+import time
+import wave
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from backend.models.session import Session
+from backend.services.audio_preprocessing import preprocess_audio
+from backend.services.openai_service import OpenAIService
+from backend.services.turn_manager import TurnManager
+from backend.utils import metrics
+from backend.utils.metrics import span
+
+# speech comes back as raw 16-bit mono PCM so frames can be played as they arrive
+OUTPUT_SAMPLE_RATE = 24000
+
+# a sentence ends at . ! ? (or …), optionally followed by closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]”’]*\s+")
+
+VOICE_STAGE_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "semantics_voice_stage_seconds",
+    "Time from the end of the learner's utterance to each point of the voice pipeline.",
+    ("stage",)
+))
+
+def wav_from_pcm(pcm: bytes, sample_rate: int) -> bytes:
+    # wraps raw 16-bit mono PCM (e.g. streamed microphone frames) so it can be preprocessed and uploaded
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buf.getvalue()
+
+class SentenceSplitter:
+    # accumulates streamed reply deltas and hands back each sentence once it is complete
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest or None
+
+class _Speech:
+    # synthesis of one sentence, started immediately and buffered until its turn to play
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._pump(chunks))
+
+    async def _pump(self, chunks: AsyncIterator[bytes]):
+        leftover = b""
+        try:
+            async for chunk in chunks:
+                # keep frames on whole 16-bit samples
+                chunk = leftover + chunk
+                usable = len(chunk) - (len(chunk) % 2)
+                leftover = chunk[usable:]
+                if usable:
+                    self._chunks.put_nowait(chunk[:usable])
+        finally:
+            self._chunks.put_nowait(None)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        # surfaces a synthesis error once everything before it has been played
+        await self._task
+
+    def cancel(self):
+        self._task.cancel()
+
+class VoicePipeline:
+    # One spoken exchange end to end: preprocess -> transcribe -> streamed reply -> speech.
+    # Each complete sentence of the reply is sent to TTS as soon as it is streamed, so the
+    # learner hears the start of the answer while the rest (and the thought bubbles) are
+    # still being generated. Sentences are synthesized concurrently but their audio is
+    # forwarded in order.
+
+    def __init__(self, turn_manager: TurnManager, openai_service: OpenAIService):
+        self.turn_manager = turn_manager
+        self.openai_service = openai_service
+
+    async def run(
+            self,
+            session_id: str,
+            audio: bytes,
+            filename: str = "speech.wav",
+            session: Optional[Session] = None,
+            voice: str = "verse",
+            defer_bubbles: bool = False,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        # yields ("transcript", {"text", "silent"}), ("delta", text), ("audio", pcm bytes),
+        # ("audio_end", None), ("turn", TurnData) and finally ("latency", {stage: ms})
+        started = time.perf_counter()
+        latency: Dict[str, float] = {}
+
+        def mark(stage: str):
+            if stage not in latency:
+                seconds = time.perf_counter() - started
+                latency[stage] = round(seconds * 1000, 1)
+                VOICE_STAGE_SECONDS.observe(seconds, stage=stage)
+
+        with span("voice", "preprocess"):
+            prepared = await asyncio.to_thread(preprocess_audio, audio, filename)
+        mark("preprocess")
+
+        text = ""
+        if not prepared.is_silent:
+            text = await self.openai_service.transcribe(prepared.filename, prepared.audio)
+        mark("transcribe")
+        yield "transcript", {"text": text, "silent": prepared.is_silent}
+        if not text:
+            # nothing was said; an empty turn would also be taken as a request for the opening line
+            mark("total")
+            yield "latency", latency
+            return
+
+        events: asyncio.Queue = asyncio.Queue()
+        sentences: asyncio.Queue = asyncio.Queue()
+        speeches: List[_Speech] = []
+
+        def speak(sentence: str):
+            mark("first_sentence")
+            speech = _Speech(self.openai_service.stream_speech(sentence, voice=voice, response_format="pcm"))
+            speeches.append(speech)
+            sentences.put_nowait(speech)
+
+        async def converse():
+            splitter = SentenceSplitter()
+            async for kind, payload in self.turn_manager.stream_user_turn(session_id, text, defer_bubbles=defer_bubbles, session=session):
+                if kind == "delta":
+                    mark("first_token")
+                    for sentence in splitter.feed(payload):
+                        speak(sentence)
+                    await events.put(("delta", payload))
+                elif kind == "reply":
+                    mark("reply")
+                    rest = splitter.flush()
+                    if rest:
+                        speak(rest)
+                    sentences.put_nowait(None)
+                else:
+                    mark("turn")
+                    await events.put(("turn", payload))
+
+        async def forward_audio():
+            while True:
+                speech = await sentences.get()
+                if speech is None:
+                    break
+                async for chunk in speech:
+                    mark("first_audio")
+                    await events.put(("audio", chunk))
+            mark("audio_done")
+            await events.put(("audio_end", None))
+
+        tasks = [asyncio.create_task(converse()), asyncio.create_task(forward_audio())]
+        for task in tasks:
+            task.add_done_callback(lambda t: events.put_nowait(("done", t)))
+
+        try:
+            remaining = len(tasks)
+            while remaining:
+                kind, payload = await events.get()
+                if kind == "done":
+                    remaining -= 1
+                    if not payload.cancelled() and payload.exception() is not None:
+                        raise payload.exception()
+                    continue
+                yield kind, payload
+        finally:
+            # also stops synthesis of sentences that were never forwarded
+            for task in tasks:
+                task.cancel()
+            for speech in speeches:
+                speech.cancel()
+
+        mark("total")
+        yield "latency", latency
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Every outbound OpenAI call goes through one scheduler per worker. Each model gets
+# its own concurrency limit, token-bucket rate limit and bounded wait queue; calls
+# that fail with 429/5xx or a dropped connection are retried with jittered
+# exponential backoff, and nothing waits or retries past the deadline of the
+# request that caused it. A full queue fails fast with SchedulerBusy (a 503 with
+# Retry-After) instead of piling up more work behind a struggling upstream.
+
+class SchedulerBusy(Exception):
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(f"Too many queued calls to {model}; retry in {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    pass
+
+# Absolute time.monotonic() deadline of the current request, or None for no limit.
+_deadline: ContextVar[Optional[float]] = ContextVar("outbound_deadline", default=None)
+
+def set_deadline(seconds: Optional[float]):
+    return _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+def remaining_time() -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def detached_task(coro) -> asyncio.Task:
+    # background work that outlives the request (deferred bubbles, summaries, pool
+    # refills) must not inherit the request's deadline
+    context = copy_context()
+    context.run(_deadline.set, None)
+    return asyncio.create_task(coro, context=context)
+
+def _check_deadline(model: str) -> Optional[float]:
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"Request deadline passed before calling {model}")
+    return remaining
+
+class TokenBucket:
+    # rate tokens per second up to burst; rate <= 0 disables the limit
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        # takes a token now and returns how long to wait before using it; the balance
+        # goes negative so later callers queue up behind earlier ones
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+class ModelLimiter:
+    def __init__(self, model: str, concurrency: int, rate: float, burst: float, max_queue: int):
+        self.model = model
+        self.concurrency = max(concurrency, 1)
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.waiting = 0
+        self.in_flight = 0
+        self.stats = {
+            "calls": 0,
+            "rejected": 0,
+            "retries": 0,
+            "failures": 0,
+            "deadline_exceeded": 0,
+            "max_queue_depth": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def retry_after(self) -> int:
+        # rough time for the current queue to drain at the configured rate
+        rate = self.bucket.rate if self.bucket.rate > 0 else float(self.concurrency)
+        return max(1, math.ceil((self.waiting + 1) / rate))
+
+    def record_wait(self, seconds: float):
+        self.stats["wait_seconds_total"] += seconds
+        self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], seconds)
+
+    def snapshot(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "concurrency": self.concurrency,
+            "rate_per_second": self.bucket.rate,
+            "max_queue": self.max_queue,
+            "avg_wait_seconds": round(self.stats["wait_seconds_total"] / calls, 4) if calls else 0.0,
+        }
+
+def _retry_after_header(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+class CallScheduler:
+    def __init__(
+            self,
+            concurrency: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+            rate: float = float(os.getenv("OPENAI_RATE_PER_SECOND", "10")),
+            burst: Optional[float] = float(os.getenv("OPENAI_RATE_BURST", "0")) or None,
+            max_queue: int = int(os.getenv("OPENAI_MAX_QUEUE", "64")),
+            max_retries: int = int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+            retry_base_seconds: float = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.5")),
+            retry_max_seconds: float = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "8")),
+            model_limits: Optional[Dict[str, dict]] = None,
+    ):
+        # model_limits overrides the defaults per model, e.g. {"gpt-5": {"concurrency": 4, "rate": 2}};
+        # OPENAI_MODEL_LIMITS takes the same mapping as JSON
+        self.defaults = {"concurrency": concurrency, "rate": rate, "burst": burst, "queue": max_queue}
+        self.model_limits = model_limits if model_limits is not None else json.loads(os.getenv("OPENAI_MODEL_LIMITS", "{}"))
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._limiters: Dict[str, ModelLimiter] = {}
+
+    def limiter(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            config = {**self.defaults, **self.model_limits.get(model, {})}
+            limiter = ModelLimiter(
+                model,
+                concurrency=int(config["concurrency"]),
+                rate=float(config["rate"]),
+                burst=float(config["burst"] or config["concurrency"]),
+                max_queue=int(config["queue"]),
+            )
+            self._limiters[model] = limiter
+        return limiter
+
+    def check_admission(self, model: str):
+        # lets streaming endpoints fail with a 503 before the response has started
+        limiter = self.limiter(model)
+        if limiter.waiting >= limiter.max_queue:
+            limiter.stats["rejected"] += 1
+            raise SchedulerBusy(model, limiter.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        # holds one of the model's concurrency slots for the body of the block
+        limiter = self.limiter(model)
+        self.check_admission(model)
+
+        started = time.monotonic()
+        limiter.waiting += 1
+        limiter.stats["max_queue_depth"] = max(limiter.stats["max_queue_depth"], limiter.waiting)
+        try:
+            timeout = _check_deadline(model)
+            await asyncio.wait_for(limiter.semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            limiter.stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"Request deadline passed while queued for {model}")
+        except DeadlineExceeded:
+            limiter.stats["deadline_exceeded"] += 1
+            raise
+        finally:
+            limiter.waiting -= 1
+
+        limiter.record_wait(time.monotonic() - started)
+        limiter.stats["calls"] += 1
+        limiter.in_flight += 1
+        try:
+            yield limiter
+        finally:
+            limiter.in_flight -= 1
+            limiter.semaphore.release()
+
+    async def _take_token(self, limiter: ModelLimiter):
+        delay = limiter.bucket.reserve()
+        if delay <= 0:
+            return
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            limiter.bucket.refund()
+            limiter.stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"Rate limit for {limiter.model} would overrun the request deadline")
+        limiter.record_wait(delay)
+        await asyncio.sleep(delay)
+
+    async def _backoff(self, limiter: ModelLimiter, attempt: int, exc: Exception) -> bool:
+        # sleeps before the next attempt; False when the error or the deadline rules one out
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return False
+        delay = random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+        server_hint = _retry_after_header(exc)
+        if server_hint is not None:
+            delay = max(delay, min(server_hint, self.retry_max_seconds))
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return False
+        limiter.stats["retries"] += 1
+        logger.warning("Retrying %s call in %.2fs after %s (attempt %d)", limiter.model, delay, exc, attempt + 1)
+        await asyncio.sleep(delay)
+        return True
+
+    async def _attempt(self, limiter: ModelLimiter, awaitable: Awaitable):
+        try:
+            timeout = _check_deadline(limiter.model)
+        except DeadlineExceeded:
+            awaitable.close()
+            limiter.stats["deadline_exceeded"] += 1
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            limiter.stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"Request deadline passed while calling {limiter.model}")
+
+    async def call(self, model: str, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        # make_call builds a fresh awaitable per attempt
+        async with self.slot(model) as limiter:
+            attempt = 0
+            while True:
+                await self._take_token(limiter)
+                try:
+                    return await self._attempt(limiter, make_call())
+                except DeadlineExceeded:
+                    raise
+                except Exception as exc:
+                    if not await self._backoff(limiter, attempt, exc):
+                        limiter.stats["failures"] += 1
+                        raise
+                    attempt += 1
+
+    async def stream(self, model: str, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        # like call() for streaming responses: the slot is held until the stream ends, and
+        # opening the stream is retried up to the first item; after that nothing is replayed
+        async with self.slot(model) as limiter:
+            attempt = 0
+            while True:
+                await self._take_token(limiter)
+                stream = open_stream()
+                try:
+                    first = await self._attempt(limiter, stream.__anext__())
+                    break
+                except StopAsyncIteration:
+                    return
+                except DeadlineExceeded:
+                    raise
+                except Exception as exc:
+                    if not await self._backoff(limiter, attempt, exc):
+                        limiter.stats["failures"] += 1
+                        raise
+                    attempt += 1
+
+            try:
+                yield first
+                async for item in stream:
+                    yield item
+            finally:
+                if hasattr(stream, "aclose"):
+                    await stream.aclose()
+
+    def stats(self) -> dict:
+        return {model: limiter.snapshot() for model, limiter in self._limiters.items()}
+
+_scheduler: Optional[CallScheduler] = None
+
+def get_scheduler() -> CallScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = CallScheduler()
+    return _scheduler
@@ -0,0 +1,32 @@
+import os
+from typing import Optional
+
+import httpx
+
+# One pooled client per worker so outbound calls reuse keep-alive connections
+# instead of paying a new TLS handshake every request.
+_client: Optional[httpx.AsyncClient] = None
+
+def init_http_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("HTTP_TIMEOUT", "60")),
+        connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = init_http_client()
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
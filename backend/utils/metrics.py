@@ -0,0 +1,203 @@
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Minimal Prometheus text-format metrics: counters, histograms and callback
+# collectors, rendered by GET /metrics. Timing spans feed one histogram labelled
+# by component and operation and, when enabled for the request, the response's
+# Server-Timing header.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def _bucket_line(self, key: Tuple[str, ...], le: str, count: int) -> str:
+        le_label = 'le="%s"' % le
+        return f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {count}"
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, entry in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                lines.append(self._bucket_line(key, _format_value(bound), cumulative))
+            lines.append(self._bucket_line(key, "+Inf", entry[-1]))
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        # collector returns already-formatted exposition lines, for values owned elsewhere
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+SPAN_SECONDS = REGISTRY.register(Histogram(
+    "semantics_span_duration_seconds", "Time spent in an instrumented operation.", ("component", "operation")
+))
+SPAN_ERRORS = REGISTRY.register(Counter(
+    "semantics_span_errors_total", "Instrumented operations that raised.", ("component", "operation")
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "semantics_http_request_duration_seconds", "HTTP request latency until the response body completes.", ("method", "route", "status")
+))
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    # nearest-rank
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def gauge_lines(name: str, help_text: str, samples: List[Tuple[Dict[str, str], float]], kind: str = "gauge") -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        names = tuple(labels)
+        lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+    return lines
+
+# Server-Timing entries of the current request: {name: [total_ms, count]}, or None when not collected.
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "0") == "1"
+_server_timing: ContextVar[Optional[Dict[str, list]]] = ContextVar("server_timing", default=None)
+
+def start_server_timing() -> Dict[str, list]:
+    entries: Dict[str, list] = {}
+    _server_timing.set(entries)
+    return entries
+
+def server_timing_header(entries: Dict[str, list], total_seconds: float) -> str:
+    parts = [
+        f'{name};dur={total_ms:.1f};desc="x{count}"' if count > 1 else f"{name};dur={total_ms:.1f}"
+        for name, (total_ms, count) in entries.items()
+    ]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+def _record(component: str, operation: str, seconds: float, failed: bool):
+    SPAN_SECONDS.observe(seconds, component=component, operation=operation)
+    if failed:
+        SPAN_ERRORS.inc(component=component, operation=operation)
+    entries = _server_timing.get()
+    if entries is not None:
+        entry = entries.setdefault(f"{component}.{operation}", [0.0, 0])
+        entry[0] += seconds * 1000
+        entry[1] += 1
+
+@contextmanager
+def span(component: str, operation: str):
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record(component, operation, time.perf_counter() - started, failed)
+
+def timed(component: str, operation: Optional[str] = None):
+    # decorator for plain, async and async-generator functions; a generator's span
+    # covers the whole iteration
+    def decorate(fn):
+        name = operation or fn.__name__
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def gen_wrapper(*args, **kwargs):
+                with span(component, name):
+                    async for item in fn(*args, **kwargs):
+                        yield item
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(component, name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(component, name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
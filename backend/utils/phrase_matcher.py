@@ -0,0 +1,53 @@
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Set, Tuple
+
+# words keep inner apostrophes ("don't") but lose surrounding punctuation ("day!" -> "day")
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*")
+
+def normalize_tokens(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+class PhraseMatcher:
+    # Token trie over normalized phrases. Counting walks the trie from every token
+    # position, so one pass over a turn finds every single- and multi-word phrase,
+    # bounded by the longest phrase rather than the number of phrases.
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases: Set[str] = set()
+        self._root: dict = {}
+        for phrase in phrases:
+            tokens = normalize_tokens(phrase)
+            if not tokens or phrase in self.phrases:
+                continue
+            node = self._root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            # several spellings can normalize to the same tokens; credit all of them
+            node.setdefault(None, []).append(phrase)
+            self.phrases.add(phrase)
+
+    def iter_matches(self, tokens: List[str]) -> Iterator[str]:
+        root = self._root
+        n = len(tokens)
+        for start, token in enumerate(tokens):
+            node = root.get(token)
+            pos = start + 1
+            while node is not None:
+                if None in node:
+                    yield from node[None]
+                if pos >= n:
+                    break
+                node = node.get(tokens[pos])
+                pos += 1
+
+    def total(self, text: str) -> int:
+        return sum(1 for _ in self.iter_matches(normalize_tokens(text)))
+
+@lru_cache(maxsize=256)
+def _compile(phrases: Tuple[str, ...]) -> PhraseMatcher:
+    return PhraseMatcher(phrases)
+
+def compile_matcher(phrases: Iterable[str]) -> PhraseMatcher:
+    # compiled once per distinct phrase list (i.e. per scenario vocabulary) and reused
+    return _compile(tuple(phrases))
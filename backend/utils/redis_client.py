@@ -1,27 +1,428 @@
+import os
 import redis
-import json
+import redis.asyncio as aioredis
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from backend.utils import serialization
+
+# Layout: session:{id} is a hash of JSON-encoded metadata fields and
+# session:{id}:turns is a list the turns are RPUSHed onto, so a turn costs O(1)
+# instead of rewriting the whole session. Older deployments stored the whole
+# session as one JSON string under session:{id}; those are migrated on read.
+
+# Extra lifetime after a session's duration_seconds so /end and /score can still
+# read it; after that Redis expires the keys on its own.
+SESSION_TTL_GRACE_SECONDS = int(os.getenv("SESSION_TTL_GRACE_SECONDS", "3600"))
 
 def init_redis():
-    client = redis.Redis(
-        host="localhost",
-        port=6379,
-        db=0,
+    # a blocking pool makes callers wait for a free connection instead of erroring when it is exhausted
+    pool = aioredis.BlockingConnectionPool(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "5")),
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "5")),
+        socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "2")),
+        health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
         decode_responses=True
     )
+    client = aioredis.Redis(connection_pool=pool)
 
     return client
 
+# Plain integer field in the session hash, bumped by every write below; lets a
+# per-worker cache tell whether its decoded copy is still current.
+VERSION_FIELD = "version"
+
+def session_ttl(duration_seconds: int) -> int:
+    return int(duration_seconds) + SESSION_TTL_GRACE_SECONDS
+
+# Request-scoped count of Redis network round trips; each helper below costs
+# exactly one (a pipeline counts once) unless noted.
+_round_trips: ContextVar[Optional[list]] = ContextVar("redis_round_trips", default=None)
+
+def start_round_trip_count() -> list:
+    counter = [0]
+    _round_trips.set(counter)
+    return counter
+
+def _round_trip(n: int = 1):
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += n
+
 def session_key(session_id: str) -> str:
     return f"session:{session_id}"
 
-def save_session(client, session_id: str, session_obj: dict): 
-    client.set(session_key(session_id), json.dumps(session_obj))
+def turns_key(session_id: str) -> str:
+    return f"session:{session_id}:turns"
+
+# HSET only when the session hash still exists, so writes never resurrect a deleted
+# session; returns the new version, or 0 if the session is gone
+_HSET_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return redis.call('HINCRBY', KEYS[1], 'version', 1)
+"""
+
+# RPUSH only when the session hash still exists and the list is at the expected
+# length; returns {new length (the turn number), new version}, 0 if the session is
+# gone, or -(actual next turn number) if another turn was committed first. Any
+# further ARGV pairs are HSET on the session in the same step (e.g. running scores).
+_RPUSH_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local expected = tonumber(ARGV[2])
+if expected then
+    local next_turn = redis.call('LLEN', KEYS[2]) + 1
+    if next_turn ~= expected then
+        return -next_turn
+    end
+end
+local length = redis.call('RPUSH', KEYS[2], ARGV[1])
+if #ARGV > 2 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    redis.call('PEXPIRE', KEYS[2], ttl)
+end
+return {length, redis.call('HINCRBY', KEYS[1], 'version', 1)}
+"""
+
+# Store final_feedback only if the session has none yet; returns the stored value
+# (this call's or an earlier one's), or false if the session is gone. ARGV[2..4]
+# are the encodings of null, ARGV[5..] further field pairs written on success.
+_FINALIZE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local current = redis.call('HGET', KEYS[1], 'final_feedback')
+if current and current ~= ARGV[2] and current ~= ARGV[3] and current ~= ARGV[4] then
+    return current
+end
+redis.call('HSET', KEYS[1], 'final_feedback', ARGV[1])
+if #ARGV > 4 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 5))
+end
+redis.call('HINCRBY', KEYS[1], 'version', 1)
+return ARGV[1]
+"""
+
+# bump the version of a session that still exists, for writes that only touch the turns list
+_BUMP_VERSION = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+return redis.call('HINCRBY', KEYS[1], 'version', 1)
+"""
+
+# Session hash plus the turns from summarized_turns on, read atomically:
+# {hash as flat pairs, index of the first turn returned, turns}. Returns false if the
+# session is gone and 'legacy' for a single-blob session (migrated by a full load).
+# summarized_turns is read as the stored JSON integer, with or without the format tag.
+_LOAD_WINDOW = """
+local kind = redis.call('TYPE', KEYS[1])['ok']
+if kind == 'none' then
+    return false
+end
+if kind ~= 'hash' then
+    return 'legacy'
+end
+local first = 0
+local summarized = redis.call('HGET', KEYS[1], 'summarized_turns')
+if summarized then
+    if string.byte(summarized, 1) == 1 then
+        summarized = string.sub(summarized, 2)
+    end
+    first = tonumber(summarized) or 0
+end
+first = math.min(first, redis.call('LLEN', KEYS[2]))
+return {redis.call('HGETALL', KEYS[1]), first, redis.call('LRANGE', KEYS[2], first, -1)}
+"""
+
+def _encode_fields(fields: dict) -> dict:
+    return {key: serialization.dumps(value) for key, value in fields.items()}
+
+def _decode_fields(raw: dict) -> dict:
+    return {key: serialization.loads(value) for key, value in raw.items()}
+
+def _queue_full_write(pipe, session_id: str, session_obj: dict):
+    meta = {k: v for k, v in session_obj.items() if k != "turn_history"}
+    turns = session_obj.get("turn_history", [])
+
+    pipe.delete(session_key(session_id), turns_key(session_id))
+    pipe.hset(session_key(session_id), mapping=_encode_fields(meta))
+    pipe.hincrby(session_key(session_id), VERSION_FIELD, 1)
+    if turns:
+        pipe.rpush(turns_key(session_id), *[serialization.dumps(t) for t in turns])
+    if "duration_seconds" in session_obj:
+        ttl = session_ttl(session_obj["duration_seconds"])
+        pipe.expire(session_key(session_id), ttl)
+        if turns:
+            pipe.expire(turns_key(session_id), ttl)
+
+async def save_session(client, session_id: str, session_obj: dict):
+    async with client.pipeline(transaction=True) as pipe:
+        _queue_full_write(pipe, session_id, session_obj)
+        await pipe.execute()
+    _round_trip()
+
+async def load_session(client, session_id: str, include_turns: bool = True):
+    # MULTI so the version in the hash always matches the turns read with it
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.hgetall(session_key(session_id))
+        if include_turns:
+            pipe.lrange(turns_key(session_id), 0, -1)
+        results = await pipe.execute(raise_on_error=False)
+    _round_trip()
+
+    meta = results[0]
+    if isinstance(meta, redis.ResponseError):
+        # WRONGTYPE: a legacy single-blob session
+        migrated = await migrate_legacy_session(client, session_id)
+        if migrated is not None and not include_turns:
+            migrated["turn_history"] = []
+        return migrated
+    if not meta:
+        return None
+
+    data = _decode_fields(meta)
+    data["turn_history"] = [serialization.loads(t) for t in results[1]] if include_turns else []
+    return data
+
+async def load_session_window(client, session_id: str):
+    # the metadata plus only the turns from summarized_turns on, which is all a new turn
+    # needs (prompt window and next turn number), so its cost doesn't grow with the
+    # conversation; turns_offset is the number of turns left out
+    _round_trip()
+    result = await client.eval(_LOAD_WINDOW, 2, session_key(session_id), turns_key(session_id))
+    if result is None:
+        return None
+    if result == "legacy":
+        return await load_session(client, session_id)
+
+    meta, offset, turns = result
+    data = _decode_fields(dict(zip(meta[::2], meta[1::2])))
+    data["turn_history"] = [serialization.loads(t) for t in turns]
+    data["turns_offset"] = int(offset)
+    return data
+
+async def load_sessions(client, session_ids: List[str]) -> List[Optional[dict]]:
+    # many sessions in one pipelined round trip; legacy blobs fall back to load_session
+    if not session_ids:
+        return []
+    async with client.pipeline(transaction=False) as pipe:
+        for session_id in session_ids:
+            pipe.hgetall(session_key(session_id))
+            pipe.lrange(turns_key(session_id), 0, -1)
+        results = await pipe.execute(raise_on_error=False)
+    _round_trip()
 
-def load_session(client, session_id: str):
-    data = client.get(session_key(session_id))
-    if data: 
-        return json.loads(data)
+    sessions = []
+    for i, session_id in enumerate(session_ids):
+        meta, turns = results[2 * i], results[2 * i + 1]
+        if isinstance(meta, redis.ResponseError):
+            sessions.append(await load_session(client, session_id))
+        elif not meta:
+            sessions.append(None)
+        else:
+            data = _decode_fields(meta)
+            data["turn_history"] = [serialization.loads(t) for t in turns]
+            sessions.append(data)
+    return sessions
+
+async def scan_session_ids(client, count: int = 500):
+    async for key in client.scan_iter(match="session:*", count=count):
+        if key.endswith(":turns"):
+            continue
+        yield key[len("session:"):]
+
+async def load_session_version(client, session_id: str) -> Optional[int]:
+    _round_trip()
+    version = await client.hget(session_key(session_id), VERSION_FIELD)
+    return int(version) if version is not None else None
+
+async def update_session_fields(client, session_id: str, fields: dict) -> int:
+    # returns the session's new version, 0 if it no longer exists
+    _round_trip()
+    if not fields:
+        version = await client.hget(session_key(session_id), VERSION_FIELD)
+        return int(version) if version is not None else int(await client.exists(session_key(session_id)))
+    args = []
+    for key, value in _encode_fields(fields).items():
+        args.extend([key, value])
+    return int(await client.eval(_HSET_IF_EXISTS, 1, session_key(session_id), *args))
+
+async def finalize_session(client, session_id: str, final_feedback: dict, fields: Optional[dict] = None) -> Optional[dict]:
+    # one-time compare-and-set; returns whichever final_feedback ends up stored
+    _round_trip()
+    args = [serialization.dumps(final_feedback), *serialization.encodings(None)]
+    for key, value in _encode_fields(fields or {}).items():
+        args.extend([key, value])
+    stored = await client.eval(_FINALIZE, 1, session_key(session_id), *args)
+    return serialization.loads(stored) if stored else None
+
+async def append_turn(client, session_id: str, turn_obj, expected_turn_number: Optional[int] = None, fields: Optional[dict] = None) -> Tuple[int, Optional[int]]:
+    # returns (script result as above, new version or None when nothing was written)
+    _round_trip()
+    expected = "" if expected_turn_number is None else str(expected_turn_number)
+    encoded = turn_obj if isinstance(turn_obj, str) else serialization.dumps(turn_obj)
+    args = [encoded, expected]
+    for key, value in _encode_fields(fields or {}).items():
+        args.extend([key, value])
+    result = await client.eval(_RPUSH_IF_EXISTS, 2, session_key(session_id), turns_key(session_id), *args)
+    if isinstance(result, list):
+        return int(result[0]), int(result[1])
+    return int(result), None
+
+async def load_turn(client, session_id: str, turn_number: int) -> Optional[dict]:
+    _round_trip()
+    data = await client.lindex(turns_key(session_id), turn_number - 1)
+    if data:
+        return serialization.loads(data)
     return None
 
-def delete_session(client, session_id: str): 
-    client.delete(session_key(session_id))
+async def set_turn(client, session_id: str, turn_number: int, turn_obj: dict) -> int:
+    # returns the session's new version
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.lset(turns_key(session_id), turn_number - 1, serialization.dumps(turn_obj))
+        pipe.eval(_BUMP_VERSION, 1, session_key(session_id))
+        results = await pipe.execute()
+    _round_trip()
+    return int(results[-1])
+
+async def replace_turns(client, session_id: str, turns: List[dict]):
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.delete(turns_key(session_id))
+        if turns:
+            pipe.rpush(turns_key(session_id), *[serialization.dumps(t) for t in turns])
+        pipe.eval(_BUMP_VERSION, 1, session_key(session_id))
+        pipe.pttl(session_key(session_id))
+        results = await pipe.execute()
+    _round_trip()
+
+    ttl = results[-1]
+    if turns and ttl > 0:
+        _round_trip()
+        await client.pexpire(turns_key(session_id), ttl)
+
+async def delete_session(client, session_id: str):
+    _round_trip()
+    await client.delete(session_key(session_id), turns_key(session_id))
+
+async def migrate_legacy_session(client, session_id: str):
+    # WATCH, TYPE, GET and MULTI/EXEC
+    _round_trip(4)
+    key = session_key(session_id)
+    async with client.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(key)
+            if await pipe.type(key) != "string":
+                await pipe.unwatch()
+                return None
+            session_obj = serialization.loads(await pipe.get(key))
+            pipe.multi()
+            _queue_full_write(pipe, session_id, session_obj)
+            await pipe.execute()
+        except redis.WatchError:
+            # another worker migrated it first; read the new layout
+            return await load_session(client, session_id)
+    return session_obj
+
+async def migrate_sessions(client) -> int:
+    migrated = 0
+    async for key in client.scan_iter(match="session:*", _type="string"):
+        session_id = key[len("session:"):]
+        if session_id.endswith(":turns"):
+            continue
+        if await migrate_legacy_session(client, session_id) is not None:
+            migrated += 1
+    return migrated
+
+def scenario_pool_key(difficulty: str, category: str) -> str:
+    return f"scenario_pool:{difficulty}:{category}"
+
+async def pop_pooled_scenario(client, difficulty: str, category: str):
+    # LPOP and the remaining length in one round trip; returns (scenario dict or None, remaining)
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.lpop(scenario_pool_key(difficulty, category))
+        pipe.llen(scenario_pool_key(difficulty, category))
+        data, remaining = await pipe.execute()
+    _round_trip()
+    return (serialization.loads(data) if data else None), remaining
+
+async def push_pooled_scenarios(client, difficulty: str, category: str, scenarios: List[dict]) -> int:
+    if not scenarios:
+        return await pool_size(client, difficulty, category)
+    _round_trip()
+    return await client.rpush(scenario_pool_key(difficulty, category), *[serialization.dumps(s) for s in scenarios])
+
+async def pool_size(client, difficulty: str, category: str) -> int:
+    _round_trip()
+    return await client.llen(scenario_pool_key(difficulty, category))
+
+async def acquire_lock(client, name: str, ttl_seconds: int) -> bool:
+    # best-effort cross-worker lock; it simply expires, so no explicit release is needed
+    _round_trip()
+    return bool(await client.set(f"lock:{name}", "1", nx=True, ex=ttl_seconds))
+
+async def release_lock(client, name: str):
+    _round_trip()
+    await client.delete(f"lock:{name}")
+
+# LLM response cache: llm_cache:{digest} strings with a TTL, plus a sorted set of the
+# entry keys scored by last use, so the cache can be held to a maximum number of entries
+LLM_CACHE_INDEX = "llm_cache:index"
+
+def llm_cache_key(digest: str) -> str:
+    return f"llm_cache:{digest}"
+
+# GET the entry and, on a hit, restart its TTL and move it to the most recently used end of
+# the index; on a miss the (expired) member is dropped from the index instead
+_LLM_CACHE_GET = """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    redis.call('ZREM', KEYS[2], KEYS[1])
+    return false
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('ZADD', KEYS[2], 'XX', ARGV[1], KEYS[1])
+return value
+"""
+
+# SET the entry, record it in the index and drop index members unused for longer than the
+# TTL (their keys have expired); returns how many entries are over ARGV[4]
+_LLM_CACHE_PUT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[2]))
+return redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+"""
+
+async def load_llm_response(client, digest: str, now: float, ttl_seconds: int) -> Optional[str]:
+    _round_trip()
+    data = await client.eval(_LLM_CACHE_GET, 2, llm_cache_key(digest), LLM_CACHE_INDEX, now, int(ttl_seconds))
+    return serialization.loads(data) if data else None
+
+async def save_llm_response(client, digest: str, content: str, now: float, ttl_seconds: int, max_entries: int) -> int:
+    # returns how many least recently used entries were evicted to stay within max_entries;
+    # one round trip, three when evicting (pop the oldest index members, then delete their keys)
+    _round_trip()
+    excess = int(await client.eval(
+        _LLM_CACHE_PUT, 2, llm_cache_key(digest), LLM_CACHE_INDEX,
+        serialization.dumps(content), int(ttl_seconds), now, int(max_entries)
+    ))
+    if excess <= 0:
+        return 0
+    evicted = [member for member, _ in await client.zpopmin(LLM_CACHE_INDEX, excess)]
+    if evicted:
+        await client.delete(*evicted)
+    _round_trip(2)
+    return len(evicted)
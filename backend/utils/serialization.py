@@ -0,0 +1,39 @@
+import json
+import os
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # plain json still works, just slower
+    orjson = None
+
+# Stored values are tagged with a leading format byte. Untagged values are the
+# legacy json.dumps text written before the tag existed and are read as such.
+# The tags stay within ASCII so the client can keep decode_responses=True.
+FORMAT_ORJSON = "\x01"
+
+SESSION_SERIALIZER = os.getenv("SESSION_SERIALIZER", "orjson" if orjson is not None else "json")
+
+def dumps(obj: Any) -> str:
+    if SESSION_SERIALIZER == "orjson" and orjson is not None:
+        return FORMAT_ORJSON + orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+def loads(data):
+    if isinstance(data, bytes):
+        data = data.decode()
+    if data[:1] == FORMAT_ORJSON:
+        payload = data[1:]
+        return orjson.loads(payload) if orjson is not None else json.loads(payload)
+    return json.loads(data)
+
+def encodings(obj: Any) -> list:
+    # the forms dumps() may have written for a scalar like None, for comparisons done inside Redis
+    text = json.dumps(obj, separators=(",", ":"))
+    return [FORMAT_ORJSON + text, text, json.dumps(obj)]
+
+def dumps_model(model) -> str:
+    # pydantic-core writes the model straight to JSON without an intermediate dict
+    if SESSION_SERIALIZER == "orjson":
+        return FORMAT_ORJSON + model.__pydantic_serializer__.to_json(model).decode()
+    return model.model_dump_json()
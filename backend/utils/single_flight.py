@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class _Abandoned(Exception):
+    # set on a flight whose leader was cancelled, so its waiters retry instead of failing
+    pass
+
+class SingleFlight:
+    # Concurrent calls for the same key share one execution: the first caller runs it and
+    # the rest await its result. An error reaches every waiter, but the leader being
+    # cancelled (its request timed out or the client went away) is not: the waiters
+    # retry and one of them runs the call instead.
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        # returns (result, shared); shared is True when another caller's call produced it
+        while True:
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            try:
+                return await asyncio.shield(pending), True
+            except _Abandoned:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.set_exception(_Abandoned())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # mark retrieved so a failure nobody else awaited doesn't log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
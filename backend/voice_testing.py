@@ -1,7 +1,7 @@
-import os, tempfile, time
+import argparse, asyncio, io, os, queue, tempfile, threading, time
+from collections import defaultdict
 import numpy as np
 import sounddevice as sd
-from scipy.io import wavfile
 from scipy.io.wavfile import write as wav_write
 
 from dotenv import load_dotenv
@@ -12,10 +12,13 @@ from backend.services.openai_service import OpenAIService
 from backend.services.scenario_generator import ScenarioGenerator
 from backend.services.session_manager import SessionManager
 from backend.services.turn_manager import TurnManager
+from backend.services.voice_pipeline import VoicePipeline, OUTPUT_SAMPLE_RATE
+from backend.utils.metrics import percentile
 from openai import OpenAI
 oai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 SAMPLE_RATE = 16000
+BLOCK_SECONDS = 0.02
 
 def record_push_to_talk(seconds: float = 4.0) -> str:
     print(f"\n🎙Recording for {seconds:.1f}s... (speak now)")
@@ -27,14 +30,26 @@ def record_push_to_talk(seconds: float = 4.0) -> str:
     print("recorded:", path)
     return path
 
-def play_wav(path: str):
-    try:
-        sr, data = wavfile.read(path)
-        sd.play(data, sr)
-        sd.wait()
-    except Exception as e:
-        print("Audio playback error:", e)
-
+def record_until_silence(silence_seconds: float = 0.8, max_seconds: float = 15.0, threshold: float = 0.01) -> bytes:
+    # push-to-talk without a fixed length: stops once speech has been followed by
+    # silence_seconds of quiet (RMS below threshold, full scale = 1.0), returns WAV bytes
+    print("\n🎙Listening... (speak now, stops when you pause)")
+    block = int(SAMPLE_RATE * BLOCK_SECONDS)
+    blocks, heard, quiet = [], False, 0.0
+    with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype="int16", blocksize=block) as stream:
+        for _ in range(int(max_seconds / BLOCK_SECONDS)):
+            data, _ = stream.read(block)
+            blocks.append(data.copy())
+            rms = float(np.sqrt(np.mean((data.astype(np.float32) / 32768.0) ** 2)))
+            if rms >= threshold:
+                heard, quiet = True, 0.0
+            elif heard:
+                quiet += BLOCK_SECONDS
+                if quiet >= silence_seconds:
+                    break
+    buf = io.BytesIO()
+    wav_write(buf, SAMPLE_RATE, np.concatenate(blocks))
+    return buf.getvalue()
 
 def stt_transcribe(wav_path: str) -> str:
     with open(wav_path, "rb") as f:
@@ -44,33 +59,137 @@ def stt_transcribe(wav_path: str) -> str:
         )
     return tr.text.strip()
 
-def tts_speak_to_file(text: str) -> str:
-    out = tempfile.mktemp(suffix=".wav")
+TTS_PCM_SAMPLE_RATE = 24000
+
+def tts_stream_play(text: str):
+    # plays raw 24 kHz PCM as it arrives instead of waiting for a whole WAV file
     with oai.audio.speech.with_streaming_response.create(
         model="gpt-4o-mini-tts",
         voice="verse",
         input=text,
-        response_format="wav",
-    ) as resp:
-        resp.stream_to_file(out)
-    return out
-
-def bootstrap_services():
+        response_format="pcm",
+    ) as resp, sd.RawOutputStream(samplerate=TTS_PCM_SAMPLE_RATE, channels=1, dtype="int16") as out:
+        leftover = b""
+        for chunk in resp.iter_bytes(4096):
+            chunk = leftover + chunk
+            usable = len(chunk) - (len(chunk) % 2)
+            out.write(chunk[:usable])
+            leftover = chunk[usable:]
+
+class PcmPlayer:
+    # plays 16-bit mono PCM frames on a background thread, so writing to the sound card
+    # never blocks the event loop that is still receiving the rest of the reply
+    def __init__(self, sample_rate: int = OUTPUT_SAMPLE_RATE):
+        self._frames = queue.Queue()
+        self._thread = threading.Thread(target=self._play, args=(sample_rate,), daemon=True)
+        self._thread.start()
+
+    def _play(self, sample_rate: int):
+        try:
+            with sd.RawOutputStream(samplerate=sample_rate, channels=1, dtype="int16") as out:
+                while (frame := self._frames.get()) is not None:
+                    out.write(frame)
+        except Exception as e:
+            print("Audio playback error:", e)
+
+    def write(self, frame: bytes):
+        self._frames.put(frame)
+
+    def close(self):
+        # returns once everything queued has been played
+        self._frames.put(None)
+        self._thread.join()
+
+async def pipeline_turn(pipeline: VoicePipeline, session_id: str, wav_bytes: bytes, play: bool = True) -> dict:
+    # the same STT -> streamed reply -> sentence-by-sentence TTS pipeline as the /sessions/{id}/voice
+    # socket; speech for the first sentences plays while the thought bubbles are still being generated.
+    # Returns the stage latencies (ms after recording stopped), including when playback finished
+    player = PcmPlayer() if play else None
+    started = time.perf_counter()
+    latency = {}
+    try:
+        async for kind, payload in pipeline.run(session_id, wav_bytes, "speech.wav"):
+            if kind == "transcript":
+                print(f"You said: {payload['text']!r}" + (" (silence)" if payload["silent"] else ""))
+                if payload["text"]:
+                    print("LLM: ", end="", flush=True)
+            elif kind == "delta":
+                print(payload, end="", flush=True)
+            elif kind == "audio" and player is not None:
+                player.write(payload)
+            elif kind == "turn":
+                print()
+                for bubble in payload.bubble_suggestions or []:
+                    print(f"  💭 {bubble['suggestion_text']}")
+            elif kind == "latency":
+                latency = dict(payload)
+    finally:
+        if player is not None:
+            await asyncio.to_thread(player.close)
+            latency["playback_done"] = round((time.perf_counter() - started) * 1000, 1)
+    return latency
+
+def print_latency(latency: dict):
+    print(f"  {'stage':<16}{'ms':>9}{'+ms':>9}")
+    previous = 0.0
+    for stage, ms in sorted(latency.items(), key=lambda item: item[1]):
+        print(f"  {stage:<16}{ms:>9.0f}{ms - previous:>9.0f}")
+        previous = ms
+
+def print_soak_summary(samples: dict):
+    print(f"\n{'stage':<16}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, values in sorted(samples.items(), key=lambda item: percentile(sorted(item[1]), 50)):
+        values = sorted(values)
+        print(f"{stage:<16}{len(values):>5}{percentile(values, 50):>10.0f}{percentile(values, 95):>10.0f}{values[-1]:>10.0f}")
+
+async def pipelined_loop(args, session_id: str, turn_mgr: TurnManager):
+    # waiting for Enter and recording run in threads, so deferred work (history folding,
+    # bubbles) keeps going on the event loop between exchanges
+    pipeline = VoicePipeline(turn_mgr, turn_mgr.openai_service)
+    replay = open(args.wav, "rb").read() if args.wav else None
+    samples = defaultdict(list)
+
+    turn = 0
+    while args.turns == 0 or turn < args.turns:
+        turn += 1
+        if not args.turns:
+            cmd = (await asyncio.to_thread(input, "\n<Enter> to speak, or 'quit': ")).strip().lower()
+            if cmd == "quit":
+                break
+        if replay is not None:
+            wav_bytes = replay
+        else:
+            wav_bytes = await asyncio.to_thread(record_until_silence, args.silence, args.max_seconds, args.threshold)
+
+        latency = await pipeline_turn(pipeline, session_id, wav_bytes, play=not args.no_play)
+        print_latency(latency)
+        for stage, ms in latency.items():
+            samples[stage].append(ms)
+
+    if turn > 1:
+        print_soak_summary(samples)
+
+async def bootstrap_services():
     redis = init_redis()
     session_mgr = SessionManager(redis_client=redis)
     openai_svc = OpenAIService(api_key=os.getenv("OPENAI_API_KEY"))
     turn_mgr = TurnManager(session_manager=session_mgr, openai_service=openai_svc)
     scenario = ScenarioGenerator().generate_random_scenario("medium")
-    session_id = session_mgr.create_session("CLI Tester", "medium", 600)
-    session_mgr.update_session(session_id, {"context": scenario.dict()})
+    session_id = await session_mgr.create_session("CLI Tester", "medium", 600, context=scenario.model_dump())
     return session_id, turn_mgr
 
-def main():
+async def main(args):
     if not os.getenv("OPENAI_API_KEY"):
         raise RuntimeError("OPENAI_API_KEY not set")
 
-    session_id, turn_mgr = bootstrap_services()
+    session_id, turn_mgr = await bootstrap_services()
     print("\nSession started:", session_id)
+
+    if args.pipeline:
+        await pipelined_loop(args, session_id, turn_mgr)
+        print("\ndone!")
+        return
+
     print("Press Enter to record 4s… (type 'quit' to exit)")
 
     while True:
@@ -82,15 +201,27 @@ def main():
         user_text = stt_transcribe(wav_in)
         print(f"You said: {user_text!r}")
 
-        turn = turn_mgr.process_user_turn(session_id=session_id, user_input=user_text)
+        turn = await turn_mgr.process_user_turn(session_id=session_id, user_input=user_text)
         ai_text = turn.ai_response
         print(f"LLM: {ai_text}")
 
-        wav_out = tts_speak_to_file(ai_text)
         print("Speaking response…")
-        play_wav(wav_out)
+        try:
+            tts_stream_play(ai_text)
+        except Exception as e:
+            print("Audio playback error:", e)
 
     print("\ndone!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Voice conversation test loop")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="pipelined mode: in-memory audio, streamed reply, TTS per sentence, latency breakdown")
+    parser.add_argument("--silence", type=float, default=0.8, help="seconds of quiet that end an utterance")
+    parser.add_argument("--max-seconds", type=float, default=15.0, help="longest utterance recorded")
+    parser.add_argument("--threshold", type=float, default=0.01, help="RMS level counted as speech (full scale = 1.0)")
+    parser.add_argument("--wav", help="replay this recording every turn instead of using the microphone")
+    parser.add_argument("--turns", type=int, default=0, help="run this many exchanges without prompting (0 = interactive)")
+    parser.add_argument("--no-play", action="store_true", help="skip audio playback")
+    args = parser.parse_args()
+    asyncio.run(main(args))
\ No newline at end of file